@@ -1,19 +1,19 @@
-import os
 from connectors.cortex_llm import correct_with_llm
-from lxml import etree
+from utils.fragment_validation import FragmentValidator
+from utils.xml_document import XmlDocument, as_document
 
 from dotenv import load_dotenv  
 
 load_dotenv()
 
-def handle_xml_correction(xml_file: str, instruction: str = None, xpath: list = None) -> dict:
+def handle_xml_correction(xml_file, instruction: str = None, xpath: list = None) -> dict:
     """
-    Corrige un fichier XML en utilisant un modèle de langage et enregistre le résultat.
+    Corrige un document XML en utilisant un modèle de langage.
     
     Args:
-        xml_file (str): Chemin vers le fichier XML à corriger
+        xml_file (XmlDocument | str): Document partagé par les agents, ou chemin vers le fichier XML à corriger
         instruction (str, optional): Instructions pour la correction
-        xpath (str, optional): Expression XPath indiquant la partie à corriger
+        xpath (list, optional): Expressions XPath indiquant les parties à corriger
         
     Returns:
         dict: Dictionnaire contenant le statut de l'opération et des informations supplémentaires
@@ -23,23 +23,31 @@ def handle_xml_correction(xml_file: str, instruction: str = None, xpath: list =
         return {"status": "error", "message": "Chemin du fichier XML non spécifié"}
         
     try:
-        # Génération du nom du fichier de sortie
-        tree = etree.parse(xml_file)
-        output_filename = f"corrected_files/{os.path.basename(xml_file)}"
-        os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+        document = as_document(xml_file)
         
-        # Correction du XML avec le modèle de langage
-        corrected_content = correct_with_llm(tree, instruction, xpath)
+        # Correction du XML avec le modèle de langage, directement sur l'arbre en mémoire
+        changes = []
+        # Chaque fragment renvoyé est validé contre le schéma avant d'être fusionné
+        validator = FragmentValidator.for_root(document.tree.getroot(), document.path)
+        correct_with_llm(document.tree, instruction, xpath, changes, validator)
         
-        # Enregistrement du résultat
-        with open(output_filename, "w", encoding="utf-8") as f:
-            f.write(corrected_content)
-            
-        return {
+        # Le validateur ne revalidera que les fragments remplacés
+        if changes:
+            document.mark_changed(changes)
+        
+        result = {
             "status": "success", 
-            "message": f"Fichier corrigé et enregistré sous {output_filename}",
-            "output_path": output_filename
+            "message": f"Document {document.filename} corrigé ({len(changes)} fragment(s) remplacé(s))",
+            "document": document
         }
+        
+        # Appel avec un chemin : le résultat est enregistré comme auparavant
+        if not isinstance(xml_file, XmlDocument):
+            output_filename = document.save(f"corrected_files/{document.filename}")
+            result["message"] = f"Fichier corrigé et enregistré sous {output_filename}"
+            result["output_path"] = output_filename
+        
+        return result
     except Exception as e:
         return {
             "status": "error", 
@@ -51,6 +59,6 @@ def corrector_agent(xml_file, instruction, xpath):
     result = handle_xml_correction(xml_file=xml_file, instruction=instruction, xpath=xpath)
     if result["status"] == "success":
         print(result["message"])
-        return result['output_path']
+        return result.get('output_path', result['document'])
     else:
         print(f"Échec: {result['message']}")
\ No newline at end of file
@@ -1,33 +1,14 @@
 import os
-from dotenv import load_dotenv
-import snowflake.connector
 import re
 import xml.etree.ElementTree as ET
 import lxml.etree as lxmlET
 from copy import deepcopy
-
-# Load .env file
-load_dotenv()
-
-# Read variables
-sf_account = os.getenv("SNOWFLAKE_ACCOUNT")
-sf_user = os.getenv("SNOWFLAKE_USERNAME")
-sf_password = os.getenv("SNOWFLAKE_PASSWORD")
-sf_database = os.getenv("SNOWFLAKE_DATABASE")
-sf_schema = os.getenv("SNOWFLAKE_SCHEMA")
-sf_warehouse = os.getenv("SNOWFLAKE_WAREHOUSE")
-sf_role = os.getenv("SNOWFLAKE_ROLE")
-
-# Connect to Snowflake
-conn = snowflake.connector.connect(
-    user=sf_user,
-    password=sf_password,
-    account=sf_account,
-    warehouse=sf_warehouse,
-    database=sf_database,
-    schema=sf_schema,
-    role=sf_role
-)
+from config import FRAGMENT_VALIDATION_RETRIES, MODIFIER_FULL_FALLBACK_MAX_KB
+from connectors.cortex_llm import complete_routed
+from connectors.llm_backend import CassetteMiss, agent_deadline, discard_response, get_llm_backend, uncached
+from connectors.model_router import escalate, route
+from utils.fragment_validation import FragmentValidator
+from utils.xml_document import XmlDocument
 
 ## S1000D norms library - organized by different aspects of the specification
 S1000D_NORMS = {
@@ -192,18 +173,23 @@ def extract_element_path_from_instruction(instruction, xml_str):
     return "/dmodule/content/procedure/mainProcedure"
 
 class ModifierAgent:
-    def __init__(self, conn, model_name="sonnet"):
-        self.conn = conn
-        self.model = AVAILABLE_MODELS.get(model_name.lower(), AVAILABLE_MODELS["sonnet"])
-        print(f"Using model: {self.model}")
+    def __init__(self, backend=None, model_name="auto", use_cache=True):
+        # Cortex (behind the completion cache unless use_cache=False), or a recorder/replayer for offline runs
+        self.backend = backend or get_llm_backend(cache=use_cache)
+        if model_name.lower() == "auto":
+            self.model = None  # Routed per call by connectors.model_router
+            print("Using model: routed per call")
+        else:
+            self.model = AVAILABLE_MODELS.get(model_name.lower(), AVAILABLE_MODELS["sonnet"])
+            print(f"Using model: {self.model}")
 
     def get_relevant_s1000d_norms(self, xml_content, instruction):
         """Get relevant S1000D norms based on XML content and instruction."""
         xml_categories = analyze_xml_content(xml_content)
         instruction_categories = analyze_instruction(instruction)
         
-        # Combine categories from both analyses
-        relevant_categories = list(set(xml_categories + instruction_categories))
+        # Combine categories from both analyses; ordered so the prompt (and its cache key) is stable
+        relevant_categories = list(dict.fromkeys(xml_categories + instruction_categories))
         
         # Compile relevant norms
         norms = []
@@ -300,18 +286,49 @@ INSTRUCTIONS:
 6. IMPORTANT: RETURN THE XML WRAPPED IN ```xml YOUR_XML_HERE ``` CODE BLOCKS.
 """
 
-    def run_model_on_prompt(self, prompt):
-        # You can change this if you're using Snowflake Cortex or UDF
-        
-        # query = f"select SNOWFLAKE.CORTEX.COMPLETE('claude-3-5-sonnet', $$ {prompt} $$)"
-        query = f"select SNOWFLAKE.CORTEX.COMPLETE('{self.model}', $$ {prompt} $$)"
-        cursor = self.conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchone()
-        return result[0] if result else "No result"
-
-    def merge_xml_changes(self, original_xml, modified_section, target_path):
-        """Merge the modified section back into the original XML."""
+    def run_model_on_prompt(self, prompt, task="document", validate=None):
+        """task ("fragment" or "document") and validate are used by the router when no model is pinned."""
+        if self.model is None:
+            result = complete_routed(task, prompt, validate, agent="modifier", backend=self.backend)
+        else:
+            result = self.backend.complete(self.model, prompt, agent_deadline("modifier"))
+            if result is not None and validate is not None and not validate(result):
+                discard_response(self.model, prompt, self.backend)
+        return result if result is not None else "No result"
+
+    def returns_xml(self, output):
+        """The LLM output contains well-formed XML (otherwise the router escalates)."""
+        try:
+            ET.fromstring(self.extract_xml_section(output))
+            return True
+        except ET.ParseError:
+            return False
+
+    def repair_prompt(self, prompt, previous_output, errors):
+        """The same prompt, with the rejected answer and the errors to fix."""
+        error_list = "\n".join(f"- {error}" for error in errors)
+        return f"""{prompt}
+---
+Your previous answer was rejected:
+{previous_output}
+
+Errors:
+{error_list}
+
+Fix these errors and return the complete answer again, following the same instructions.
+"""
+
+    def merge_xml_changes(self, original_xml, modified_section, target_path, errors=None):
+        """Merge the modified section back into the original XML.
+
+        On failure the original XML is returned and the reason is appended to errors.
+        """
+        def failed(message):
+            print(message)
+            if errors is not None:
+                errors.append(message)
+            return original_xml
+
         try:
             # Extract the XML declaration and DOCTYPE if present
             xml_decl = None
@@ -338,22 +355,19 @@ INSTRUCTIONS:
             
             # If the section doesn't start with '<', it might be text or invalid
             if not modified_section.startswith('<'):
-                print(f"Warning: Modified section doesn't look like valid XML: '{modified_section[:30]}...'")
-                return original_xml
+                return failed(f"Warning: Modified section doesn't look like valid XML: '{modified_section[:30]}...'")
                 
             # Parse the modified section
             try:
                 mod_section = lxmlET.fromstring(modified_section.encode('utf-8'))
             except Exception as e:
-                print(f"Error parsing modified section: {e}")
                 print(f"Modified section (first 100 chars): {modified_section[:100]}")
-                return original_xml
+                return failed(f"Error parsing modified section: {e}")
             
             # Find the target element in the original XML
             target_elems = root.xpath(target_path)
             if not target_elems:
-                print(f"Target path not found: {target_path}")
-                return original_xml
+                return failed(f"Target path not found: {target_path}")
                 
             target_elem = target_elems[0]
             
@@ -383,8 +397,7 @@ INSTRUCTIONS:
             return result_xml
             
         except Exception as e:
-            print(f"Error merging XML changes: {e}")
-            return original_xml  # Return original if merge fails
+            return failed(f"Error merging XML changes: {e}")  # Return original if merge fails
 
     def extract_xml_section(self, output):
         """Extract XML from the LLM output."""
@@ -430,6 +443,62 @@ INSTRUCTIONS:
         print("No XML structure found in output")
         return output.strip()
 
+    def process_focused(self, xml_str, root, instruction, instruction_type, target_path):
+        """Modify the target section only; the answer is sent back with its errors until it merges.
+
+        Returns the merged XML, or None after FRAGMENT_VALIDATION_RETRIES repairs.
+        The attempts are the whole budget of calls: the backend is called
+        directly and, when the model is routed, a repair goes to a stronger
+        model (connectors.model_router.escalate) instead of escalating on its own.
+        Repair prompts skip the completion cache and a rejected answer is dropped from it.
+        """
+        focused_prompt = self.generate_focused_prompt(xml_str, instruction, instruction_type, target_path)
+        validator = FragmentValidator.for_root(root)
+        prompt = focused_prompt
+        model = self.model or route("fragment", focused_prompt)
+        for attempt in range(FRAGMENT_VALIDATION_RETRIES + 1):
+            last_attempt = attempt == FRAGMENT_VALIDATION_RETRIES
+            if attempt and self.model is None:
+                model = escalate(model, "fragment", prompt) or model
+            backend = uncached(self.backend) if attempt else self.backend
+            try:
+                focused_output = backend.complete(model, prompt, agent_deadline("modifier"))
+            except CassetteMiss:
+                raise
+            except Exception as e:
+                print(f"Error querying {model}: {str(e)}")
+                return None
+            if focused_output is None:
+                focused_output = "No result"
+            
+            # Extract the XML section from the response
+            modified_section = self.extract_xml_section(focused_output)
+            
+            # The section is checked against the schema before the merge; on the last
+            # attempt the schema errors left are merged anyway, for the corrector
+            errors = validator.errors(modified_section, target_path) if validator else []
+            schema_rejected = bool(errors)
+            if not errors or last_attempt:
+                errors = []
+                result_xml = self.merge_xml_changes(xml_str, modified_section, target_path, errors)
+                if not errors:
+                    try:
+                        ET.fromstring(result_xml)
+                        if schema_rejected:
+                            discard_response(model, prompt, backend)  # Merged for the corrector, not kept
+                        return result_xml
+                    except ET.ParseError as pe:
+                        errors.append(f"Error parsing merged XML: {pe}")
+            
+            discard_response(model, prompt, backend)
+            if last_attempt:
+                break
+            print(f"Focused answer rejected ({len(errors)} error(s)), repair {attempt + 1}/{FRAGMENT_VALIDATION_RETRIES}.")
+            prompt = self.repair_prompt(focused_prompt, modified_section, errors)
+        
+        print(f"Focused approach failed after {FRAGMENT_VALIDATION_RETRIES} repair(s).")
+        return None
+
     def process(self, xml_str, instruction, instruction_type):
         """Process the XML based on the instruction."""
         try:
@@ -442,30 +511,28 @@ INSTRUCTIONS:
             # Try the focused approach first
             target_path = extract_element_path_from_instruction(instruction, xml_str)
             
+            root = lxmlET.fromstring(xml_str.encode('utf-8'))
+            if target_path and not root.xpath(target_path):
+                print(f"Target path not found: {target_path}")
+                target_path = None
+            
             if target_path:
                 print(f"Using focused approach on path: {target_path}")
-                focused_prompt = self.generate_focused_prompt(xml_str, instruction, instruction_type, target_path)
-                focused_output = self.run_model_on_prompt(focused_prompt)
-                
-                # Extract the XML section from the response
-                modified_section = self.extract_xml_section(focused_output)
-                
-                # Merge the changes back into the original XML
-                result_xml = self.merge_xml_changes(xml_str, modified_section, target_path)
-                
-                # Verify the result is valid XML
-                try:
-                    ET.fromstring(result_xml)
+                result_xml = self.process_focused(xml_str, root, instruction, instruction_type, target_path)
+                if result_xml is not None:
                     return [result_xml]
-                except ET.ParseError as pe:
-                    print(f"Error parsing merged XML: {pe}. Falling back to full document approach.")
             else:
                 print("No target path identified, falling back to full document approach")
             
-            # Fall back to full document approach if focused approach fails
+            # Last resort: the whole document in and out, only for documents small enough
+            size_kb = len(xml_str.encode('utf-8')) / 1024
+            if size_kb > MODIFIER_FULL_FALLBACK_MAX_KB:
+                print(f"Document too large for the full document approach ({size_kb:.0f} KB).")
+                return [f"Error: The modification could not be applied to the target section. Original XML preserved.\n\n{xml_str}"]
+            
             print("Using full document approach")
             full_prompt = self.generate_full_prompt(xml_str, instruction, instruction_type)
-            full_output = self.run_model_on_prompt(full_prompt)
+            full_output = self.run_model_on_prompt(full_prompt, "document", self.returns_xml)
             
             # Extract XML from the response
             full_xml = self.extract_xml_section(full_output)
@@ -479,6 +546,8 @@ INSTRUCTIONS:
                 # If still invalid, return with error
                 return [f"Error: The LLM generated invalid XML. Original XML preserved.\n\n{xml_str}"]
                 
+        except CassetteMiss:
+            raise
         except Exception as e:
             print(f"Error during processing: {e}")
             return [f"Error during processing: {str(e)}. Original XML preserved.\n\n{xml_str}"]
@@ -632,22 +701,12 @@ def extract_instructions_from_prompt(prompt: str) -> list[str]:
         
     return instructions
 
-def main(xml_file_path:str, prompt:str, output_directory:str, expected_result:str, model_name="sonnet"):
-
-    # Read initial XML file
-    xml_content = read_file(xml_file_path)
-    if not xml_content:
-        print("Error: Could not read XML file.")
-        return
-    
+def apply_instructions(xml_content: str, prompt: str, agent, output_directory: str = None) -> str:
+    """Apply each instruction of the prompt in turn and return the resulting XML."""
     # Get all instruction files from the directory and sort them
     instruction_files = extract_instructions_from_prompt(prompt)
     
-    # Create output directory if it doesn't exist
-    os.makedirs(output_directory, exist_ok=True)
-    
     current_xml = xml_content
-    agent = ModifierAgent(conn, model_name=model_name)
     
     print(f"Found {len(instruction_files)} instruction files to process sequentially.")
     
@@ -671,17 +730,44 @@ def main(xml_file_path:str, prompt:str, output_directory:str, expected_result:st
             instruction_type=instruction_type
         )
         
-        if results:
+        if results and results[0].lstrip().startswith('<'):
             # Update the current XML with the result of this instruction
             current_xml = results[0]  # Assuming process() returns a list, take the first result
             
             # Optionally save intermediate results
-            intermediate_file = os.path.join(output_directory, f"intermediate_result_{i+1}.xml")
-            with open(intermediate_file, 'w', encoding='utf-8') as file:
-                file.write(current_xml)
-            print(f"Intermediate result saved to {intermediate_file}")
+            if output_directory:
+                intermediate_file = os.path.join(output_directory, f"intermediate_result_{i+1}.xml")
+                with open(intermediate_file, 'w', encoding='utf-8') as file:
+                    file.write(current_xml)
+                print(f"Intermediate result saved to {intermediate_file}")
         else:
-            print(f"Warning: No results returned for instruction {instruction_file}")
+            print(f"Warning: No usable result returned for instruction {instruction_file}")
+    
+    return current_xml
+
+def modify_document(document: XmlDocument, prompt: str, model_name="auto") -> XmlDocument:
+    """Apply the instructions to the shared in-memory document; nothing is written to disk."""
+    agent = ModifierAgent(model_name=model_name)
+    original_xml = document.to_string()
+    modified_xml = apply_instructions(original_xml, prompt, agent)
+    
+    if modified_xml != original_xml:
+        document.replace_content(modified_xml)
+    return document
+
+def main(xml_file_path:str, prompt:str, output_directory:str, expected_result:str, model_name="auto"):
+
+    # Read initial XML file
+    xml_content = read_file(xml_file_path)
+    if not xml_content:
+        print("Error: Could not read XML file.")
+        return
+    
+    # Create output directory if it doesn't exist
+    os.makedirs(output_directory, exist_ok=True)
+    
+    agent = ModifierAgent(model_name=model_name)
+    current_xml = apply_instructions(xml_content, prompt, agent, output_directory)
     
     # Save the final result after all instructions have been applied
     final_output_path = os.path.join(output_directory, os.path.basename(xml_file_path))
@@ -723,7 +809,12 @@ if __name__ == "__main__":
 
 def agent_modifier (xml_file_path, instructions_directory):
     output_directory = "corrected_files/"
-    model_name = 'sonnet'
+    model_name = 'auto'
+    
+    # Shared in-memory document: modified in place, saved once by the orchestrator
+    if isinstance(xml_file_path, XmlDocument):
+        return modify_document(xml_file_path, instructions_directory, model_name)
+    
     expected_result = 'testing_cases/TC1_additions_1/expected_result/DMC-BRAKE-AAA-DA1-00-00-00AA-341A-A_002-00_en-US.XML'
 
     main(xml_file_path, instructions_directory, output_directory, expected_result, model_name)
@@ -1,18 +1,25 @@
-from utils.xml_utils import validate_xml_and_extract_paths
-from connectors.snowflake_conn import insert_error_to_snowflake
-from connectors.cortex_llm import explain_error_with_llm
-import os
+from utils.xml_utils import use_streaming_validation, validate_xml_records
+from connectors.audit_writer import insert_error_to_snowflake
+from connectors.cortex_llm import explain_signatures_with_llm
+from config import RULE_FIXERS_ENABLED
+from utils.incremental_validation import validate_document
+from utils.validation_errors import cluster_records, format_clusters, record_paths
+from utils.xml_document import XmlDocument, as_document
 
 from lxml import etree
 
-def run_validator_agent(xml_path: str):
-    filename = os.path.basename(xml_path)  # Assuming the filename is the last part of the path
-    parser = etree.XMLParser(recover=True)
+def run_validator_agent(xml_file):
+    """Validate an XmlDocument (or a file path) against its S1000D schema."""
+    document = as_document(xml_file)
+    filename = document.filename
     
     try:
-        tree = etree.parse(xml_path, parser)
-        tree.write(xml_path, pretty_print=True, encoding="utf-8", xml_declaration=True)
-        print(f"Fichier XML {filename} analysé et reformaté.")
+        if not document.is_loaded and use_streaming_validation(document.path):
+            # Large data module: validated in streaming mode, never loaded as a whole
+            print(f"Fichier XML {filename} volumineux, validation en streaming.")
+        else:
+            document.tree  # Parsed once here, then shared by all the agents
+            print(f"Fichier XML {filename} analysé.")
     except etree.XMLSyntaxError as syntax_err:
         error_msg = str(syntax_err)
         print(f"Erreur de syntaxe XML: {error_msg}")
@@ -23,34 +30,51 @@ def run_validator_agent(xml_path: str):
         return
     
     try:
-        error_msg, error_paths = validate_xml_and_extract_paths(xml_path, tree)
-        if not error_msg:
+        if not document.is_loaded:
+            records = validate_xml_records(document.path)
+        else:
+            # Only the subtrees changed since the last validation are revalidated
+            records = validate_document(document)
+            # Mechanical errors are fixed by rule; only the others cost LLM calls
+            if records and RULE_FIXERS_ENABLED:
+                from utils.rule_fixers import apply_rule_fixers
+                records = apply_rule_fixers(document, records)
+                # Appel avec un chemin : les corrections par règle sont enregistrées dans le fichier,
+                # auquel correspondent les chemins d'erreur renvoyés
+                if document.dirty and not isinstance(xml_file, XmlDocument):
+                    print(f"Corrections par règle enregistrées dans {document.save()}.")
+        if not records:
             insert_error_to_snowflake(filename, "valid", "/", "/", "/", "/")
             print("✅ XML is valid according to the schema.")
             return "valid", "", ""
         else:
             print("❌ XML is invalid. Analyzing...\n")
-            explanation = explain_error_with_llm(error_msg)
-            #print("🔧 LLM Suggestion:\n")
-            llm_suggestion = explanation  # The suggestion provided by LLM
-            # Insert the error details into Snowflake
-            insert_error_to_snowflake(filename, "invalid", "error_msg", "/", " ".join(error_paths), llm_suggestion)
+            # One explanation per class of error (signature), reused across files
+            clusters = cluster_records(records)
+            explanations = explain_signatures_with_llm(list(clusters))
+            print(f"{len(records)} erreur(s), {len(clusters)} classe(s) d'erreur distincte(s).")
+            llm_suggestion = format_clusters(clusters, explanations)
+            error_paths = record_paths(records)
+            # Insert the error details into Snowflake, with the explanation of its class for each error
+            for signature, group in clusters.items():
+                for record in group:
+                    insert_error_to_snowflake(filename, "invalid", record.to_text(), "/", record.path, explanations[signature])
             return "invalid", llm_suggestion, error_paths
     except Exception as e:
         print(f"Error: {e}")
     
 
 def handle_message(message: dict) -> dict:
-    xml_path = message.get("xml_path")
-    if not xml_path:
-        return {"status": "error", "message": "Missing 'xml_path' in message"}
+    xml_file = message.get("document") or message.get("xml_path")
+    if not xml_file:
+        return {"status": "error", "message": "Missing 'document' or 'xml_path' in message"}
     
-    status, suggestions, xpath = run_validator_agent(xml_path)
+    status, suggestions, xpath = run_validator_agent(xml_file)
     return status, suggestions, xpath
 
 
 def agent_validator(xml_file):
-    validity, suggestions, xpath = handle_message({"xml_path": xml_file})
+    validity, suggestions, xpath = handle_message({"document": xml_file})
     if validity == "valid":
         return validity, "", ""
     elif validity == "invalid":
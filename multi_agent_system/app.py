@@ -3,10 +3,12 @@ import os
 import tempfile
 import shutil
 from utils.xml_utils import extract_instructions_from_file
-from connectors.snowflake_conn import get_snowflake_connection
+from connectors.cortex_llm import complete_routed
+from orchestrator import is_decision
 from agent_corrector import corrector_agent
 from agent_validator import agent_validator
 from agent_modifier import agent_modifier
+from utils.xml_document import XmlDocument
 import time
 
 def log_and_display(log_placeholder, full_log, message):
@@ -15,16 +17,16 @@ def log_and_display(log_placeholder, full_log, message):
     time.sleep(0.3)
 
 
-def call_corrector_agent(xml_file_path, suggestion, xpath, log_placeholder, full_log):
+def call_corrector_agent(document, suggestion, xpath, log_placeholder, full_log):
     log_and_display(log_placeholder, full_log, " Appel à l'agent correcteur")
-    xml_file_correct_path = corrector_agent(xml_file_path, suggestion, xpath)
-    return xml_file_correct_path
+    corrected_document = corrector_agent(document, suggestion, xpath)
+    return corrected_document or document
 
 
-def call_modifier_agent(xml_file_path, instructions, log_placeholder, full_log):
+def call_modifier_agent(document, instructions, log_placeholder, full_log):
     log_and_display(log_placeholder, full_log, " Appel à l'agent modificateur")
-    agent_modifier(xml_file_path, instructions)
-    return xml_file_path
+    agent_modifier(document, instructions)
+    return document
 
 def process_file(file_path, instructions, log_placeholder):
     """Process the uploaded file with the given instructions"""
@@ -39,6 +41,9 @@ def process_file(file_path, instructions, log_placeholder):
     max_iterations = 10  # Safety limit
     
     full_log = []  # Initialize the log
+    
+    # Parsed once and shared by all agents; written back to disk only at the end
+    document = XmlDocument.load(file_path)
 
     while should_continue and iteration < max_iterations:
         iteration += 1
@@ -46,12 +51,12 @@ def process_file(file_path, instructions, log_placeholder):
         progress_bar.progress(progress)
         
         status_message.text(f"Iteration {iteration}: Validating file...")
-        status, suggestions, xpath = agent_validator(file_path)
+        status, suggestions, xpath = agent_validator(document)
         log_and_display(log_placeholder, full_log, f"Iteration {iteration}: Validation done.")
         
         status_message.text(f"Iteration {iteration}: Orchestrating next action...")
-        file_path, decision = orchestrator_llm(
-            status, suggestions, instructions, file_path, xpath, has_been_modified, log_placeholder, full_log
+        document, decision = orchestrator_llm(
+            status, suggestions, instructions, document, xpath, has_been_modified, log_placeholder, full_log
         )
         
         if decision == "modification":
@@ -67,13 +72,13 @@ def process_file(file_path, instructions, log_placeholder):
     if iteration >= max_iterations and should_continue:
         st.warning("Reached maximum iterations. Process may not be complete.")
     
-    return file_path
+    return document.save()
 
 
-def orchestrator_llm(status, suggestions, instructions, xml_file_path, xpath, has_been_modified, log_placeholder, full_log):
+def orchestrator_llm(status, suggestions, instructions, document, xpath, has_been_modified, log_placeholder, full_log):
     # Nettoyage des entrées
-    status_clean = status.replace("'", "''").replace("\n", " ").replace("\r", " ") if status else ""
-    suggestions_clean = suggestions.replace("'", "''").replace("\n", " ").replace("\r", " ") if suggestions else ""
+    status_clean = status.replace("\n", " ").replace("\r", " ") if status else ""
+    suggestions_clean = suggestions.replace("\n", " ").replace("\r", " ") if suggestions else ""
 
     prompt = f"""
     Vous êtes un agent orchestrateur responsable de vérifier, corriger et modifier un fichier XML.
@@ -94,36 +99,25 @@ def orchestrator_llm(status, suggestions, instructions, xml_file_path, xpath, ha
     """
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
-
-        sql = """
-        SELECT SNOWFLAKE.cortex.COMPLETE(
-            'claude-3-5-sonnet',
-            '{}'
-        )
-        """.format(prompt)
+        # The answer must start with one of the three decisions, otherwise a stronger model is asked
+        response = complete_routed("decision", prompt, validate=is_decision, agent="orchestrator")
 
-        cursor.execute(sql)
-        result = cursor.fetchone()
-
-        if result and result[0]:
-            response = result[0]
+        if response:
             decision = response.strip().lower().split()[0]
             log_and_display(log_placeholder, full_log, f" Décision extraite de l'agent orchestrateur : {decision}")
 
             if decision == "correction":
                 log_and_display(log_placeholder, full_log, "❌ Correction requise.")
-                xml_file_path = call_corrector_agent(xml_file_path, suggestions, xpath, log_placeholder, full_log)
+                document = call_corrector_agent(document, suggestions, xpath, log_placeholder, full_log)
             elif decision == "modification":
                 log_and_display(log_placeholder, full_log, "✅ Modification requise.")
-                xml_file_path = call_modifier_agent(xml_file_path, instructions, log_placeholder, full_log)
+                document = call_modifier_agent(document, instructions, log_placeholder, full_log)
             elif decision == "stop":
                 log_and_display(log_placeholder, full_log, "🛑 Le fichier est valide et a été modifié. Arrêt du pipeline.")
             else:
                 raise ValueError(f"Décision inattendue de Mistral : {decision}")
 
-            return xml_file_path, decision
+            return document, decision
         else:
             raise ValueError("Aucune réponse obtenue de Mistral")
 
@@ -133,12 +127,6 @@ def orchestrator_llm(status, suggestions, instructions, xml_file_path, xpath, ha
         log_and_display(log_placeholder, full_log, traceback.format_exc())
         raise RuntimeError(f"Échec de l'agent orchestrateur : {str(e)}")
 
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
-
 st.markdown("""
     <style>
     .title-style {
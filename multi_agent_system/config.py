@@ -15,3 +15,67 @@ SNOWFLAKE_CONFIG = {
     "role": os.getenv("SNOWFLAKE_ROLE"),
     "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE")
 }
+
+# Schema validation
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_DIR = os.getenv("SCHEMA_DIR", os.path.join(BASE_DIR, "data", "xml_schema_flat"))
+SCHEMA_SNAPSHOT_DIR = os.getenv("SCHEMA_SNAPSHOT_DIR", os.path.join(BASE_DIR, "data", "schema_snapshots"))
+SCHEMA_CATALOG_EXTRA = os.getenv("SCHEMA_CATALOG_EXTRA", "")  # Extra "url_prefix=directory;..." catalog entries
+SCHEMA_ALLOW_DOWNLOAD = os.getenv("SCHEMA_ALLOW_DOWNLOAD", "0") == "1"  # Fetch schemas missing from the catalog
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", "8"))  # Compiled schemas kept in memory per process
+VALIDATION_STREAMING_THRESHOLD_MB = float(os.getenv("VALIDATION_STREAMING_THRESHOLD_MB", "20"))  # Larger files are validated in streaming mode
+VALIDATION_FAST_PATH = os.getenv("VALIDATION_FAST_PATH", "1") == "1"  # Pre-validate with libxml2, xmlschema only for diagnostics
+VALIDATION_STREAMING_DEPTH = int(os.getenv("VALIDATION_STREAMING_DEPTH", "4"))  # Subtrees at this depth are validated then released in streaming mode
+FRAGMENT_VALIDATION_RETRIES = int(os.getenv("FRAGMENT_VALIDATION_RETRIES", "2"))  # LLM fragments rejected by the schema or the merge are sent back this many times (corrector and modifier)
+FRAGMENT_VALIDATION_MAX_ERRORS = int(os.getenv("FRAGMENT_VALIDATION_MAX_ERRORS", "10"))  # Schema errors of a fragment reported to the LLM
+RULE_FIXERS_ENABLED = os.getenv("RULE_FIXERS_ENABLED", "1") == "1"  # Fix mechanical schema errors without the LLM (utils.rule_fixers)
+RULE_FIXER_ATTRIBUTE_DEFAULTS = os.getenv("RULE_FIXER_ATTRIBUTE_DEFAULTS", "")  # "attribute=value;..." for required attributes the schema gives no value for
+
+# Audit table writer
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "0" if os.getenv("LLM_BACKEND") == "replay" else "1") == "1"  # Off by default for offline replay runs
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "100"))  # Rows per executemany
+AUDIT_FLUSH_INTERVAL_S = float(os.getenv("AUDIT_FLUSH_INTERVAL_S", "2"))  # Max delay before queued rows are written
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "1000"))  # Queued rows before write() blocks
+
+# Modifier agent
+MODIFIER_FULL_FALLBACK_MAX_KB = float(os.getenv("MODIFIER_FULL_FALLBACK_MAX_KB", "64"))  # Larger documents never go through the full-document prompt
+
+# Snowflake connection pool
+SNOWFLAKE_POOL_SIZE = int(os.getenv("SNOWFLAKE_POOL_SIZE", "4"))  # Max open sessions per process
+SNOWFLAKE_POOL_IDLE_TIMEOUT_S = float(os.getenv("SNOWFLAKE_POOL_IDLE_TIMEOUT_S", "900"))  # Idle sessions closed after this delay
+SNOWFLAKE_POOL_HEALTH_CHECK_S = float(os.getenv("SNOWFLAKE_POOL_HEALTH_CHECK_S", "60"))  # Ping sessions idle for longer before reuse
+SNOWFLAKE_POOL_TIMEOUT_S = float(os.getenv("SNOWFLAKE_POOL_TIMEOUT_S", "30"))  # Max wait for a free session
+
+# Cortex LLM
+CORTEX_BATCH_SIZE = int(os.getenv("CORTEX_BATCH_SIZE", "20"))  # Prompts per batched COMPLETE query
+CORRECTION_PROMPT_TOKENS = int(os.getenv("CORRECTION_PROMPT_TOKENS", "6000"))  # Fragments packed into one correction prompt
+CORTEX_MAX_CONCURRENCY = int(os.getenv("CORTEX_MAX_CONCURRENCY", "4"))  # Cortex queries in flight at once in the process (connectors/async_cortex.py)
+CORTEX_RATE_LIMIT_PER_MIN = float(os.getenv("CORTEX_RATE_LIMIT_PER_MIN", "60"))  # Cortex requests per minute, 0 = unlimited
+CORTEX_RATE_BURST = int(os.getenv("CORTEX_RATE_BURST", "10"))  # Requests allowed at once before the rate limit applies
+
+# LLM backend: cortex, record (Cortex + save cassettes) or replay (offline, from cassettes)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "cortex")
+LLM_CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", os.path.join(BASE_DIR, "data", "llm_cassettes"))
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "0")  # Simulated seconds per call, or "recorded"
+
+# LLM deadlines, hedging and retries
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "120"))  # Default deadline of a call; the query is cancelled after it
+LLM_AGENT_DEADLINES = os.getenv("LLM_AGENT_DEADLINES", "orchestrator=60;validator=120;corrector=180;modifier=300")  # "agent=seconds;..."
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))  # Send a duplicate after this latency percentile, 0 = off
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # Latencies observed before hedging starts
+LLM_HEDGE_MODELS = os.getenv("LLM_HEDGE_MODELS", "")  # "model=faster_model;..." for the duplicate, default same model
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))  # Retries of throttled or transient failures
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1"))  # First retry delay, doubled at each retry
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "30"))
+
+# LLM completion cache (SQLite, used with the cortex backend)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(BASE_DIR, "data", "llm_cache.sqlite"))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "200"))  # Least recently used entries evicted above this size
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))  # Entries older than this are recomputed, 0 = no expiry
+
+# LLM model routing (connectors/model_router.py)
+LLM_ROUTING_POLICY = os.getenv("LLM_ROUTING_POLICY", "baseline")  # baseline (model of each task unchanged), or opt-in cost, latency or quality
+LLM_TASK_MODELS = os.getenv("LLM_TASK_MODELS", "")  # Pinned models, "decision=model;explanation=model;fragment=model;document=model"
+LLM_ROUTER_MODELS = os.getenv("LLM_ROUTER_MODELS", "")  # Comma-separated models available to the account, default the baseline models of the tasks
+LLM_ROUTER_MAX_ESCALATIONS = int(os.getenv("LLM_ROUTER_MAX_ESCALATIONS", "2"))  # Stronger models tried after an unusable answer
@@ -0,0 +1,168 @@
+"""
+Shared client for Snowflake Cortex COMPLETE, with the limits of the account.
+
+Two limits keep the process under its Cortex quota:
+
+- a concurrency limit (CORTEX_MAX_CONCURRENCY queries in flight, keep it at
+  or below SNOWFLAKE_POOL_SIZE so no query waits for a connection);
+- a token bucket (CORTEX_RATE_LIMIT_PER_MIN requests per minute, bursts of
+  CORTEX_RATE_BURST).
+
+Every Cortex query of CortexBackend runs inside slot(), so the limits hold
+for the agents' threads, the hedged duplicates and the batches alike. The
+agents fan their calls out on the client's executor (run_completions,
+run_calls); the Snowflake connector is blocking, so each call runs on a
+thread with a pooled connection.
+
+Usage:
+    results = await async_cortex.complete_many([(model, prompt), ...])
+or, from synchronous code:
+    results = run_completions([(model, prompt), ...])
+    results = run_calls([(function, args), ...])
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import CORTEX_MAX_CONCURRENCY, CORTEX_RATE_BURST, CORTEX_RATE_LIMIT_PER_MIN
+
+
+def _complete(model: str, prompt: str, agent: str = None) -> str:
+    from connectors.cortex_llm import complete  # cortex_llm submits its calls through this module
+    return complete(model, prompt, agent)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; reserve() returns how long the caller must wait.
+
+    Tokens reserved for a query that is not sent are given back with refund().
+    """
+
+    def __init__(self, rate_per_s: float, capacity: int):
+        self.rate = rate_per_s
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 1) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A negative balance is the debt of the callers already waiting
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, tokens: int = 1) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+
+class AsyncCortexClient:
+    """Cortex calls with bounded concurrency and rate limiting, awaitable or from threads."""
+
+    def __init__(self, complete_fn=_complete, max_concurrency=CORTEX_MAX_CONCURRENCY,
+                 rate_per_min=CORTEX_RATE_LIMIT_PER_MIN, burst=CORTEX_RATE_BURST):
+        self.complete_fn = complete_fn
+        self.max_concurrency = max(1, max_concurrency)
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+        # Queries in flight in the whole process, whatever thread or event loop sends them
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        # Calls fanned out by the agents; their queries still wait for a slot
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="cortex")
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.throttled_s = 0.0
+
+    @contextmanager
+    def slot(self, requests: int = 1, deadline: float = None):
+        """Take requests rate tokens, then hold one of the concurrent query slots.
+
+        The rate-limit wait happens before the slot is taken, so a throttled
+        caller does not keep a slot from the others. Raises TimeoutError when
+        the tokens or a slot are not available before deadline (time.monotonic()).
+        """
+        delay = self.bucket.reserve(requests)
+        if deadline is not None and time.monotonic() + delay > deadline:
+            self.bucket.refund(requests)
+            raise TimeoutError("No Cortex request allowed by the rate before the deadline")
+        if delay:
+            with self._lock:
+                self.throttled_s += delay
+            time.sleep(delay)
+
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not self._slots.acquire(timeout=timeout):
+            self.bucket.refund(requests)
+            raise TimeoutError("No Cortex slot free before the deadline")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def _call(self, fn, *args):
+        try:
+            result = fn(*args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        with self._lock:
+            self.completed += 1
+        return result
+
+    async def call(self, fn, *args):
+        """Run fn(*args) on the client's executor; exceptions are raised."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, *args)
+
+    async def complete(self, model: str, prompt: str, agent: str = None) -> str:
+        """Run one completion; exceptions of the Snowflake call are raised."""
+        return await self.call(self.complete_fn, model, prompt, agent)
+
+    async def call_many(self, calls: list) -> list:
+        """Run (fn, args) calls concurrently; a failed one gives None at its position.
+
+        A CassetteMiss of the replay backend is raised: the run must fail on an unrecorded prompt.
+        """
+        from connectors.llm_backend import CassetteMiss  # llm_backend imports this module
+
+        results = await asyncio.gather(*(self.call(fn, *args) for fn, args in calls), return_exceptions=True)
+        for i, result in enumerate(results):
+            if isinstance(result, CassetteMiss):
+                raise result
+            if isinstance(result, Exception):
+                print(f"Error querying Snowflake Cortex for prompt {i}: {str(result)}")
+                results[i] = None
+        return results
+
+    async def complete_many(self, requests: list, agent: str = None) -> list:
+        """Run (model, prompt) completions concurrently; a failed one gives None at its position."""
+        return await self.call_many([(self.complete_fn, (model, prompt, agent)) for model, prompt in requests])
+
+    def stats(self) -> dict:
+        return {"completed": self.completed, "failed": self.failed, "throttled_s": round(self.throttled_s, 3)}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+async_cortex = AsyncCortexClient()
+
+
+def run_completions(requests: list, agent: str = None) -> list:
+    """Synchronous entry point for agents that are not running an event loop."""
+    return asyncio.run(async_cortex.complete_many(requests, agent))
+
+
+def run_calls(calls: list) -> list:
+    """Run (fn, args) calls concurrently on the shared client, from synchronous code."""
+    return asyncio.run(async_cortex.call_many(calls))
@@ -0,0 +1,121 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from config import AUDIT_BATCH_SIZE, AUDIT_ENABLED, AUDIT_FLUSH_INTERVAL_S, AUDIT_QUEUE_SIZE
+from connectors.connection_pool import pooled_connection
+
+INSERT_ERROR_SQL = """
+    INSERT INTO xml_validation_errors (
+        filename, validity, error_message, instance, path, llm_suggestion, datetime
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+_STOP = object()
+
+
+class AuditWriter:
+    """Buffered, background writer for the xml_validation_errors audit table.
+
+    Rows are queued by the agents and inserted by a daemon thread with
+    executemany, whenever batch_size rows are waiting or flush_interval
+    seconds have passed. The queue is bounded: when Snowflake cannot keep
+    up, write() blocks (backpressure) instead of growing memory. Pending
+    rows are flushed when the process exits.
+    """
+
+    def __init__(self, connection=pooled_connection, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL_S, max_queue=AUDIT_QUEUE_SIZE):
+        self.connection = connection  # Context manager factory yielding a Snowflake connection
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        atexit.register(self.close)
+
+    def write(self, filename, validity, error_msg, instance, path, llm_suggestion) -> None:
+        """Queue one audit row; blocks only when the queue is full."""
+        self._ensure_started()
+        row = (filename, validity, error_msg, instance, path, llm_suggestion, datetime.now(timezone.utc))
+        self._queue.put(row)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Write every queued row now; returns False if it did not complete within timeout."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 30) -> None:
+        """Flush the pending rows and stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        rows = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                rows.append(item)
+                if len(rows) < self.batch_size:
+                    continue
+
+            # Size threshold reached, time threshold reached, explicit flush or stop
+            if rows:
+                self._write_rows(rows)
+                rows = []
+            deadline = time.monotonic() + self.flush_interval
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def _write_rows(self, rows: list) -> None:
+        # One retry: a failed session is health-checked by the pool before it is handed out again.
+        for attempt in range(2):
+            try:
+                with self.connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        cursor.executemany(INSERT_ERROR_SQL, rows)
+                    finally:
+                        cursor.close()
+                    conn.commit()
+                self.written += len(rows)
+                return
+            except Exception as e:
+                if attempt:
+                    self.failed += len(rows)
+                    print(f"Error inserting {len(rows)} rows into Snowflake: {e}")
+
+
+audit_writer = AuditWriter()
+
+
+def insert_error_to_snowflake(filename, validity, error_msg, instance, path, llm_suggestion):
+    """Queue the error details for insertion into Snowflake (see AuditWriter)."""
+    if not AUDIT_ENABLED:
+        return
+    audit_writer.write(filename, validity, error_msg, instance, path, llm_suggestion)
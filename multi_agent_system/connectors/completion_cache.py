@@ -0,0 +1,127 @@
+"""
+Disk-backed, content-addressed cache of LLM completions.
+
+Entries are keyed by the SHA-256 of (model, normalized prompt, options) and
+stored in a SQLite file shared by the processes of the machine (Streamlit,
+batch runs). The cache is bounded in size with LRU eviction, and entries
+expire after a TTL.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import LLM_CACHE_MAX_MB, LLM_CACHE_PATH, LLM_CACHE_TTL_S
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Whitespace-insensitive form of a prompt (indentation, line endings)."""
+    return " ".join(prompt.split())
+
+
+def completion_key(model: str, prompt: str, options: dict = None) -> str:
+    payload = json.dumps([model, normalize_prompt(prompt), options or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, path: str = LLM_CACHE_PATH, max_mb: float = LLM_CACHE_MAX_MB, ttl_s: float = LLM_CACHE_TTL_S):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER,"
+                " created_at REAL, last_used REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions(last_used)")
+        return self._conn
+
+    def get(self, model: str, prompt: str, options: dict = None) -> str:
+        """Cached response, or None on a miss or an expired entry."""
+        key = completion_key(model, prompt, options)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT response, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_s and now - row[1] > self.ttl_s:
+                conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, model: str, prompt: str, response: str, options: dict = None) -> None:
+        if response is None:
+            return  # Failures are not cached
+        key = completion_key(model, prompt, options)
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, size, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._evict(conn)
+
+    def discard(self, model: str, prompt: str, options: dict = None) -> None:
+        """Forget the response of a prompt, e.g. an answer the caller rejected."""
+        key = completion_key(model, prompt, options)
+        with self._lock:
+            self._connection().execute("DELETE FROM completions WHERE key = ?", (key,))
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop the least recently used entries once the cache is over its size."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)  # Some headroom so eviction does not run on every put
+        for key, size in conn.execute("SELECT key, size FROM completions ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM completions")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "entries": entries,
+            "size_mb": round(total / (1024 * 1024), 2),
+        }
@@ -0,0 +1,220 @@
+import atexit
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import (
+    SNOWFLAKE_POOL_HEALTH_CHECK_S,
+    SNOWFLAKE_POOL_IDLE_TIMEOUT_S,
+    SNOWFLAKE_POOL_SIZE,
+    SNOWFLAKE_POOL_TIMEOUT_S,
+)
+from connectors.snowflake_conn import get_snowflake_connection
+
+
+class PoolTimeoutError(TimeoutError):
+    """No Snowflake connection became available within the checkout timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used", "last_checked")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+        self.last_checked = now
+
+
+class SnowflakeConnectionPool:
+    """Bounded pool of authenticated Snowflake sessions shared by all agents.
+
+    A thread that already holds a connection gets the same one back on
+    nested checkouts. Idle connections expire after idle_timeout seconds and
+    are health-checked before reuse when they have not been used for
+    health_check_interval seconds (or after a failed query).
+    """
+
+    def __init__(self, connection_factory=get_snowflake_connection, size=SNOWFLAKE_POOL_SIZE,
+                 idle_timeout=SNOWFLAKE_POOL_IDLE_TIMEOUT_S, health_check_interval=SNOWFLAKE_POOL_HEALTH_CHECK_S,
+                 checkout_timeout=SNOWFLAKE_POOL_TIMEOUT_S):
+        self.connection_factory = connection_factory
+        self.size = max(1, size)
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self._idle = deque()
+        self._open = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._closed = False
+        self._metrics = {
+            "checkouts": 0,
+            "reused": 0,
+            "created": 0,
+            "closed": 0,
+            "expired": 0,
+            "health_check_failures": 0,
+            "timeouts": 0,
+            "wait_time_total_s": 0.0,
+            "wait_time_max_s": 0.0,
+        }
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Check out a connection for the duration of the with block."""
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            # Nested checkout in the same thread: reuse the connection it holds
+            yield held.conn
+            return
+
+        pooled = self._acquire(self.checkout_timeout if timeout is None else timeout)
+        self._local.held = pooled
+        failed = False
+        try:
+            yield pooled.conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._local.held = None
+            self._release(pooled, failed)
+
+    def _acquire(self, timeout: float) -> _PooledConnection:
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            pooled = None
+            create = False
+            with self._cond:
+                self._expire_idle()
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics["timeouts"] += 1
+                        raise PoolTimeoutError(f"No Snowflake connection available after {timeout:g}s")
+                    self._cond.wait(remaining)
+                    self._expire_idle()
+                if self._idle:
+                    pooled = self._idle.pop()  # Most recently used first: likely still warm
+                else:
+                    self._open += 1
+                    create = True
+
+            if create:
+                try:
+                    pooled = _PooledConnection(self.connection_factory())
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                self._count("created")
+            elif not self._is_healthy(pooled):
+                self._discard(pooled)
+                self._count("health_check_failures")
+                continue
+            else:
+                self._count("reused")
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._metrics["checkouts"] += 1
+                self._metrics["wait_time_total_s"] += waited
+                self._metrics["wait_time_max_s"] = max(self._metrics["wait_time_max_s"], waited)
+            return pooled
+
+    def _release(self, pooled: _PooledConnection, failed: bool = False) -> None:
+        pooled.last_used = time.monotonic()
+        if failed:
+            pooled.last_checked = 0.0  # Check the session before handing it out again
+        if self._closed or self._is_closed(pooled):
+            self._discard(pooled)
+            return
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def _is_closed(self, pooled: _PooledConnection) -> bool:
+        try:
+            return pooled.conn.is_closed()
+        except Exception:
+            return True
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        if self._is_closed(pooled):
+            return False
+        if time.monotonic() - pooled.last_checked < self.health_check_interval:
+            return True
+        try:
+            cursor = pooled.conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        pooled.last_checked = time.monotonic()
+        return True
+
+    def _expire_idle(self) -> None:
+        # Called with self._cond held; closing is quick since the session is idle.
+        now = time.monotonic()
+        while self._idle and now - self._idle[0].last_used > self.idle_timeout:
+            pooled = self._idle.popleft()
+            self._close(pooled)
+            self._open -= 1
+            self._metrics["expired"] += 1
+            self._metrics["closed"] += 1
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        self._close(pooled)
+        with self._cond:
+            self._open -= 1
+            self._metrics["closed"] += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close(pooled: _PooledConnection) -> None:
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _count(self, metric: str) -> None:
+        with self._cond:
+            self._metrics[metric] += 1
+
+    def close_all(self) -> None:
+        """Close the idle connections (checked-out ones are closed when released)."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._close(self._idle.pop())
+                self._open -= 1
+                self._metrics["closed"] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._metrics)
+            stats.update(size=self.size, open=self._open, idle=len(self._idle), in_use=self._open - len(self._idle))
+            checkouts = stats["checkouts"]
+            stats["wait_time_avg_s"] = stats["wait_time_total_s"] / checkouts if checkouts else 0.0
+            # Connection churn: sessions opened per checkout (0 = perfect reuse)
+            stats["churn"] = stats["created"] / checkouts if checkouts else 0.0
+            return stats
+
+
+snowflake_pool = SnowflakeConnectionPool()
+atexit.register(snowflake_pool.close_all)
+
+def pooled_connection(timeout: float = None):
+    """Context manager giving a pooled Snowflake connection: `with pooled_connection() as conn:`."""
+    return snowflake_pool.connection(timeout)
+
+def pool_stats() -> dict:
+    return snowflake_pool.stats()
@@ -1,90 +1,355 @@
-from connectors.snowflake_conn import get_snowflake_connection
+import re
+import threading
+
+from config import (
+    CORRECTION_PROMPT_TOKENS,
+    FRAGMENT_VALIDATION_RETRIES,
+    LLM_ROUTER_MAX_ESCALATIONS,
+)
+from connectors.async_cortex import run_calls, run_completions
+from connectors.llm_backend import CassetteMiss, agent_deadline, discard_response, get_llm_backend
+from connectors.model_router import escalate, estimate_tokens, route
+
+
+def complete(model: str, prompt: str, agent: str = None, cache: bool = True) -> str:
+    """Single completion through the configured LLM backend, within the deadline of agent.
+
+    Repeated prompts are answered from the completion cache unless cache=False.
+    """
+    return get_llm_backend(cache).complete(model, prompt, agent_deadline(agent))
+
+
+def complete_batch(requests: list, agent: str = None, cache: bool = True) -> list:
+    """(model, prompt) pairs -> responses in the same order, None for a failed prompt.
+
+    With Cortex the prompts are sent as batched COMPLETE queries, see
+    CortexBackend.complete_batch.
+    """
+    return get_llm_backend(cache).complete_batch(requests, agent_deadline(agent))
+
+
+def complete_routed(task: str, prompt: str, validate=None, agent: str = None, model: str = None,
+                    backend=None, cache: bool = True, baseline: str = None) -> str:
+    """Completion with the model routed for task (see connectors.model_router).
+
+    baseline is the model of the call before routing when it differs from
+    the task's baseline model.
+
+    When the call fails or validate(output) is false (or raises), the prompt
+    is sent again to a stronger model, at most LLM_ROUTER_MAX_ESCALATIONS
+    times. The last output is returned even if it did not validate; a
+    rejected output is dropped from the completion cache. A
+    CassetteMiss of the replay backend is raised as is: another model would
+    only hide the unrecorded prompt.
+    """
+    backend = backend or get_llm_backend(cache)
+    model = model or route(task, prompt, baseline=baseline)
+    for attempt in range(LLM_ROUTER_MAX_ESCALATIONS + 1):
+        error = None
+        try:
+            output = backend.complete(model, prompt, agent_deadline(agent))
+            if output is not None and (validate is None or validate(output)):
+                return output
+        except CassetteMiss:
+            raise
+        except Exception as e:
+            output, error = None, e
+        discard_response(model, prompt, backend)
+        stronger = escalate(model, task, prompt) if attempt < LLM_ROUTER_MAX_ESCALATIONS else None
+        if stronger is None:
+            if error is not None:
+                raise error
+            return output
+        print(f"Réponse de {model} inutilisable pour la tâche {task}, escalade vers {stronger}.")
+        model = stronger
+
 
 def explain_error_with_llm(error_msg: str) -> str:
-    """Use direct Snowflake connection to explain the error."""
-    conn = get_snowflake_connection()
-    cursor = conn.cursor()
-    
-    # Properly escape the error message for SQL
-    cleaned_error = error_msg.replace("'", "''").replace("\n", " ").replace("\r", " ")
+    """Ask the LLM backend to explain the error."""
+    cleaned_error = error_msg.replace("\n", " ").replace("\r", " ")
     
     # Define the prompt
     prompt = f"XML validation error: {cleaned_error}"
     
-    # Call Snowflake COMPLETE function directly, following the example pattern
-    sql = """
-    SELECT SNOWFLAKE.cortex.COMPLETE(
-        'mistral-large',
-        CONCAT('You are an expert in XML schema validation. Give instruction to correct each error in the xml code: ', 
-               '{}', 
-               '\\n\\nPlease explain: 1) What is causing this error,  2) How to fix it, 3) Example of correct XML structure')
-    )
-    """.format(prompt)
-    
     try:
-        cursor.execute(sql)
-        result = cursor.fetchone()
-        if result and result[0]:
-            return result[0]
+        explanation = complete_routed(
+            "explanation",
+            "You are an expert in XML schema validation. Give instruction to correct each error in the xml code: "
+            f"{prompt}"
+            "\n\nPlease explain: 1) What is causing this error,  2) How to fix it, 3) Example of correct XML structure",
+            agent="validator",
+        )
+        if explanation:
+            return explanation
         return "No explanation available from the LLM."
     except Exception as e:
         return f"Error querying Snowflake Cortex: {str(e)}"
-    finally:
-        cursor.close()
-        conn.close()
+
+
+# Explanations of the error signatures seen during this run, shared by all the files
+_signature_explanations = {}
+_signature_lock = threading.Lock()
+
+
+def explain_signatures_with_llm(signatures: list) -> dict:
+    """One explanation per distinct ErrorSignature, asked only once per run.
+
+    The prompts only contain the signatures (no instance values), so they
+    are also served by the completion cache across runs.
+    """
+    with _signature_lock:
+        missing = [s for s in dict.fromkeys(signatures) if s not in _signature_explanations]
+    if missing:
+        prompts = [
+            "You are an expert in XML schema validation for S1000D data modules. "
+            f"Give instruction to correct this class of error: {signature.to_text()}"
+            "\n\nPlease explain: 1) What is causing this error,  2) How to fix it, 3) Example of correct XML structure"
+            for signature in missing
+        ]
+        model = route("explanation", max(prompts, key=len))
+        outputs = complete_batch([(model, prompt) for prompt in prompts], agent="validator")
+        with _signature_lock:
+            for signature, output in zip(missing, outputs):
+                if output:
+                    _signature_explanations[signature] = output
+    with _signature_lock:
+        return {s: _signature_explanations.get(s, "No explanation available from the LLM.") for s in signatures}
 
 
 
 from lxml.etree import _ElementTree
 from lxml import etree
+from utils.incremental_validation import ChangedSubtree
 
 
-def correct_with_llm(tree: _ElementTree, instruction: str, xpaths: list) -> str:
-    conn = get_snowflake_connection()
-    cursor = conn.cursor()
-    
-    # Process each XPath in the list
+def _is_xml_fragment(output: str) -> bool:
+    if not output:
+        return False
+    try:
+        etree.fromstring(output)
+        return True
+    except etree.XMLSyntaxError:
+        return False
+
+
+def _fragment_prompt(instruction: str, fragment_xml: str) -> str:
+    """Correction prompt for a single fragment."""
+    prompt = (
+        f"Instruction: {instruction}\n\n"
+        f"Fragment to correct:\n{fragment_xml}"
+    )
+    return (
+        "You are an expert in XML schema correction.  Based on the following instruction"
+        "generate the corrected version of the given XML fragment.:"
+        f"{prompt}"
+        "return only the corrected XML fragment (no explanations).\n\n"
+    )
+
+
+FRAGMENT_PATTERN = re.compile(r"=== FRAGMENT (F\d+) ===\s*(.*?)\s*=== END \1 ===", re.S)
+CODE_FENCE_PATTERN = re.compile(r"^```(?:xml)?\s*|\s*```$")
+
+
+def _multi_fragment_prompt(instruction: str, fragments: list) -> str:
+    """Correction prompt for several (fragment_id, path, xml) fragments, answered under the same IDs."""
+    blocks = "\n".join(
+        f"=== FRAGMENT {fragment_id} ===\n<!-- {path} -->\n{xml}\n=== END {fragment_id} ==="
+        for fragment_id, path, xml in fragments
+    )
+    return (
+        "You are an expert in XML schema correction. Based on the following instruction, "
+        "generate the corrected version of each XML fragment below. The fragments are independent.\n\n"
+        f"Instruction: {instruction}\n\n"
+        f"{blocks}\n\n"
+        "Return every corrected fragment between the same markers and with the same ID, "
+        "for example:\n=== FRAGMENT F1 ===\n<corrected XML>\n=== END F1 ===\n"
+        "Return only the markers and the corrected XML fragments (no explanations, no XML comments)."
+    )
+
+
+def _parse_multi_fragment_output(output: str) -> dict:
+    """fragment_id -> corrected XML, for the fragments found in the output."""
+    return {
+        fragment_id: CODE_FENCE_PATTERN.sub("", xml.strip())
+        for fragment_id, xml in FRAGMENT_PATTERN.findall(output or "")
+    }
+
+
+def _pack_fragments(fragments: list, budget_tokens: int) -> list:
+    """Split fragments into as few groups as possible under budget_tokens (first-fit decreasing).
+
+    A fragment larger than the budget gets a group of its own.
+    """
+    groups = []
+    for fragment in sorted(fragments, key=lambda f: -estimate_tokens(f[2])):
+        size = estimate_tokens(fragment[2])
+        for group in groups:
+            if group[0] + size <= budget_tokens:
+                group[0] += size
+                group[1].append(fragment)
+                break
+        else:
+            groups.append([size, [fragment]])
+    # Document order inside each prompt
+    return [sorted(group, key=lambda f: int(f[0][1:])) for _, group in groups]
+
+
+def plan_fragments(tree: _ElementTree, xpaths: list) -> list:
+    """Minimal set of disjoint (xpath, element) targets covering xpaths, in document order.
+
+    A target inside another target is dropped, the correction of the ancestor
+    covers it; so no replacement can hit an element another one detached.
+    """
+    resolved = []
     for xpath in xpaths:
         elements = tree.xpath(xpath)
-        
         if not elements:
             print(f"Warning: No elements found for XPath: {xpath}. Skipping.")
             continue
-            
-        target_elem = elements[0]
-        target_xml = etree.tostring(target_elem, pretty_print=True).decode()
-        sanitized_instruction = instruction.replace("'", "''").replace("\n", " ").replace("\r", " ")
-        
-        prompt = (
-            f"Instruction: {sanitized_instruction}\n\n"
-            f"Fragment to correct:\n{target_xml}"
-        )
-        
-        sql = """
-        SELECT SNOWFLAKE.cortex.COMPLETE(
-            'claude-3-5-sonnet',
-            CONCAT('You are an expert in XML schema correction.  Based on the following instruction', 
-                'generate the corrected version of the given XML fragment.:',
-                '{}',
-                'return only the corrected XML fragment (no explanations).\n\n')
-        )
-        """.format(prompt)
-        
-        cursor.execute(sql)
-        result = cursor.fetchone()
-        llm_output = result[0] if result and result[0] else None
+        resolved.append((xpath, elements[0]))
+
+    targeted = {elem for _, elem in resolved}
+    plan, planned = [], set()
+    for xpath, elem in resolved:
+        if elem in planned:
+            continue
+        if any(ancestor in targeted for ancestor in elem.iterancestors()):
+            print(f"Warning: XPath {xpath} is inside another corrected fragment. Skipping.")
+            continue
+        planned.add(elem)
+        plan.append((xpath, elem))
+
+    position = {elem: i for i, elem in enumerate(tree.iter())}
+    return sorted(plan, key=lambda target: position[target[1]])
+
+
+def _fragment_problems(output: str, path: str, validator=None) -> list:
+    """Reasons to reject output as the replacement of the element at path; [] when it can be merged."""
+    if not output:
+        return ["The answer contains no fragment."]
+    if validator is not None:
+        return validator.errors(output, path)
+    return [] if _is_xml_fragment(output) else ["The fragment is not well-formed XML."]
+
+
+def _retry_prompt(instruction: str, fragment_xml: str, output: str, problems: list) -> str:
+    prompt = _fragment_prompt(instruction, fragment_xml)
+    if not output:
+        return prompt
+    errors = "\n".join(problems)
+    return (
+        f"{prompt}Your previous correction was rejected:\n{output}\n\n"
+        f"Errors:\n{errors}\n\n"
+        "Fix these errors and return only the corrected XML fragment (no explanations).\n\n"
+    )
+
+
+def _correct_alone(instruction: str, fragment_xml: str, path: str, model: str, validator=None,
+                   output: str = None, problems: list = ()) -> str:
+    """Single-fragment correction, sent again with the errors of the previous answer until it fits.
+
+    FRAGMENT_VALIDATION_RETRIES bounds the calls for the fragment: a retry
+    goes to a stronger model when there is one (connectors.model_router.escalate)
+    instead of escalating on its own. Retry prompts skip the completion cache
+    and a rejected answer is dropped from it.
+    """
+    for attempt in range(max(1, FRAGMENT_VALIDATION_RETRIES)):
+        prompt = _retry_prompt(instruction, fragment_xml, output, problems)
+        if attempt:
+            model = escalate(model, "fragment", prompt) or model
+        try:
+            output = complete(model, prompt, agent="corrector", cache=not output)
+        except CassetteMiss:
+            raise
+        except Exception as e:
+            print(f"Error querying Snowflake Cortex: {str(e)}")
+            return output
+        problems = _fragment_problems(output, path, validator)
+        if not problems:
+            return output
+        discard_response(model, prompt)
+    print(f"Fragment {path} toujours rejeté : {'; '.join(problems)}")
+    return output
+
+
+def correct_with_llm(tree: _ElementTree, instruction: str, xpaths: list, changes: list = None,
+                     validator=None) -> str:
+    """Correct each fragment targeted by xpaths; replaced subtrees are appended to changes.
+
+    plan_fragments() reduces xpaths to disjoint subtrees. The fragments get
+    stable IDs (F1, F2, ... in document order) and are packed into as few
+    prompts as CORRECTION_PROMPT_TOKENS allows; the prompts run concurrently
+    through the shared Cortex client (connectors.async_cortex, concurrency
+    and rate limits) and the corrected fragments are matched back by ID.
+
+    Each corrected fragment is checked by validator (a FragmentValidator,
+    see utils.fragment_validation) against the declaration of the element it
+    replaces, or only for well-formedness without one. A fragment missing
+    from the answer or rejected is corrected on its own, with the errors of
+    the rejected answer, also concurrently.
+    """
+    sanitized_instruction = instruction.replace("\n", " ").replace("\r", " ")
+
+    # Resolve every target before the tree is modified
+    targets = plan_fragments(tree, xpaths)
+    fragments = [
+        (f"F{i + 1}", xpath, etree.tostring(target_elem, pretty_print=True).decode())
+        for i, (xpath, target_elem) in enumerate(targets)
+    ]
+    corrected = {}
+    if fragments:
+        groups = _pack_fragments(fragments, CORRECTION_PROMPT_TOKENS)
+        prompts = [_multi_fragment_prompt(sanitized_instruction, group) for group in groups]
+        model = route("fragment", max(prompts, key=len))
+        print(f"Correction de {len(fragments)} fragment(s) en {len(prompts)} requête(s) ({model}).")
+        # Independent subtrees: the latency is the one of the slowest request
+        for output in run_completions([(model, prompt) for prompt in prompts], agent="corrector"):
+            corrected.update(_parse_multi_fragment_output(output))
+
+        # Fragments missing from the answers or rejected are corrected one by one
+        paths = {
+            fragment_id: tree.getpath(target_elem)
+            for (fragment_id, _, _), (_, target_elem) in zip(fragments, targets)
+        }
+        retries = []
+        for fragment_id, xpath, fragment_xml in fragments:
+            problems = _fragment_problems(corrected.get(fragment_id), paths[fragment_id], validator)
+            if problems:
+                print(f"Fragment {fragment_id} ({xpath}) rejeté, correction individuelle : {problems[0]}")
+                retries.append((fragment_id, fragment_xml, problems))
+        # An answer with a rejected or missing fragment must not be served again by the cache
+        rejected = {fragment_id for fragment_id, _, _ in retries}
+        for group, prompt in zip(groups, prompts):
+            if any(fragment_id in rejected for fragment_id, _, _ in group):
+                discard_response(model, prompt)
+        outputs = run_calls([
+            (_correct_alone, (sanitized_instruction, fragment_xml, paths[fragment_id], model, validator,
+                              corrected.get(fragment_id), problems))
+            for fragment_id, fragment_xml, problems in retries
+        ])
+        corrected.update((fragment_id, output) for (fragment_id, _, _), output in zip(retries, outputs))
+
+    # Merge in document order; the paths are taken once every subtree is in place
+    replaced = []
+    for (fragment_id, xpath, _), (_, target_elem) in zip(fragments, targets):
+        llm_output = corrected.get(fragment_id)
         print(llm_output)
         if not llm_output:
             print(f"Warning: LLM returned no modification for XPath: {xpath}. Skipping.")
             continue
-            
+        if not _is_xml_fragment(llm_output):
+            print(f"Warning: LLM returned malformed XML for XPath: {xpath}. Skipping.")
+            continue
         
         new_elem = etree.fromstring(llm_output)
         parent = target_elem.getparent()
         if parent is not None:
             parent.replace(target_elem, new_elem)
+            replaced.append((new_elem, new_elem.tag != target_elem.tag))
         else:
             print(f"Warning: Could not find parent for element at XPath: {xpath}. Skipping.")
+    if changes is not None:
+        changes.extend(ChangedSubtree(tree.getpath(new_elem), renamed) for new_elem, renamed in replaced)
         
     
     # Return the final modified XML
@@ -94,12 +359,9 @@ def correct_with_llm(tree: _ElementTree, instruction: str, xpaths: list) -> str:
 
 def prompt_correction_with_llm(instruction: str) -> str:
 
-    conn = get_snowflake_connection()
-    cursor = conn.cursor()
-
     try:
-        # Nettoyage du texte brut (important pour SQL)
-        cleaned_instruction = instruction.replace("'", "''").replace("\n", " ").replace("\r", " ")
+        # Nettoyage du texte brut
+        cleaned_instruction = instruction.replace("\n", " ").replace("\r", " ")
 
         # Construction du prompt pour l'agent correcteur
         prompt = (
@@ -110,34 +372,18 @@ def prompt_correction_with_llm(instruction: str) -> str:
             f"Here are the instructions: {cleaned_instruction}"
         )
 
-        # Requête Snowflake Cortex
-        sql = f"""
-        SELECT SNOWFLAKE.CORTEX.COMPLETE(
-            'mistral-large',
-            '{prompt}'
-        );
-        """
-
-        cursor.execute(sql)
-        result = cursor.fetchone()
-        return result[0] if result and result[0] else "No explanation available from the LLM."
+        result = complete_routed("explanation", prompt, agent="corrector")
+        return result or "No explanation available from the LLM."
     
     except Exception as e:
         return f"Error querying Snowflake Cortex: {str(e)}"
-    
-    finally:
-        cursor.close()
-        conn.close()
 
 
 def prompt_modifier_with_llm(instruction: str, xml_input: str) -> str:
-    conn = get_snowflake_connection()
-    cursor = conn.cursor()
-
     try:
-        # Nettoyage pour éviter les erreurs SQL (échappement des apostrophes, suppressions de sauts de ligne)
-        cleaned_instruction = instruction.replace("'", "''").replace("\n", " ").replace("\r", " ")
-        cleaned_xml_input = xml_input.replace("'", "''").replace("\n", " ").replace("\r", " ")
+        # Nettoyage (suppression des sauts de ligne)
+        cleaned_instruction = instruction.replace("\n", " ").replace("\r", " ")
+        cleaned_xml_input = xml_input.replace("\n", " ").replace("\r", " ")
 
         # Construction du prompt
         prompt = (
@@ -148,20 +394,8 @@ def prompt_modifier_with_llm(instruction: str, xml_input: str) -> str:
             f"\n\nOriginal XML:\n{cleaned_xml_input}\n\nModification Instructions:\n{cleaned_instruction}"
         )
 
-        sql = f"""
-        SELECT SNOWFLAKE.CORTEX.COMPLETE(
-            'mistral-large',
-            '{prompt}'
-        );
-        """
-
-        cursor.execute(sql)
-        result = cursor.fetchone()
-        return result[0] if result and result[0] else "No modified XML was generated by the LLM."
+        result = complete_routed("document", prompt, agent="modifier", baseline="mistral-large")
+        return result or "No modified XML was generated by the LLM."
 
     except Exception as e:
-        return f"Error querying Snowflake Cortex: {str(e)}"
-
-    finally:
-        cursor.close()
-        conn.close()
\ No newline at end of file
+        return f"Error querying Snowflake Cortex: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,438 @@
+"""
+Pluggable LLM backends behind every COMPLETE call of the agents.
+
+- CortexBackend: Snowflake Cortex, the production backend.
+- RecordingBackend: forwards to another backend and saves each prompt and
+  its response as a cassette (one JSON file per prompt) in LLM_CASSETTE_DIR.
+- ReplayBackend: serves the cassettes without Snowflake, with an optional
+  simulated latency (a fixed number of seconds, or "recorded").
+- CachingBackend: serves repeated prompts from the completion cache; it wraps
+  the Cortex backend when LLM_CACHE_ENABLED is set. An answer the caller
+  rejects (validation, parsing) must be dropped with discard_response(), and
+  retry prompts sent with cache=False, so a bad answer is not served again.
+
+The backend is chosen with LLM_BACKEND=cortex|record|replay, or replaced at
+runtime with set_llm_backend() (benchmarks, regression runs).
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import (
+    CORTEX_BATCH_SIZE,
+    CORTEX_MAX_CONCURRENCY,
+    LLM_AGENT_DEADLINES,
+    LLM_BACKEND,
+    LLM_BACKOFF_BASE_S,
+    LLM_BACKOFF_MAX_S,
+    LLM_CACHE_ENABLED,
+    LLM_CASSETTE_DIR,
+    LLM_DEADLINE_S,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_MODELS,
+    LLM_HEDGE_PERCENTILE,
+    LLM_MAX_RETRIES,
+    LLM_REPLAY_LATENCY,
+)
+from connectors.async_cortex import async_cortex
+from connectors.completion_cache import CompletionCache
+from connectors.connection_pool import pooled_connection
+from utils.config_values import parse_pairs
+
+
+LATENCY_WINDOW = 200  # Recent latencies per model used for the hedging percentile
+
+
+class CassetteMiss(LookupError):
+    """The replay backend has no recorded response for a prompt."""
+
+
+class LLMBackend:
+    """Interface of the backends: complete() one prompt, complete_batch() several."""
+
+    name = "base"
+
+    def complete(self, model: str, prompt: str, timeout: float = None) -> str:
+        """Response of model to prompt, or None when the LLM gives nothing.
+
+        timeout is the deadline of the call in seconds (default LLM_DEADLINE_S).
+        """
+        raise NotImplementedError
+
+    def complete_batch(self, requests: list, timeout: float = None) -> list:
+        """(model, prompt) pairs -> responses in the same order; a failed prompt gives None.
+
+        A CassetteMiss is raised: a replay run must fail on an unrecorded prompt.
+        """
+        results = []
+        for i, (model, prompt) in enumerate(requests):
+            try:
+                results.append(self.complete(model, prompt, timeout))
+            except CassetteMiss:
+                raise
+            except Exception as e:
+                print(f"Error querying {self.name} for prompt {i}: {str(e)}")
+                results.append(None)
+        return results
+
+
+class LLMTimeoutError(TimeoutError):
+    """A completion did not finish before its deadline (the query has been cancelled)."""
+
+
+# Error messages of throttling and transient failures; every other error is permanent
+RETRYABLE_MARKERS = (
+    "429", "too many requests", "rate limit", "throttl", "quota",
+    "503", "service unavailable", "temporarily unavailable", "capacity",
+    "connection reset", "connection aborted", "could not connect",
+)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, LLMTimeoutError):
+        return False  # The deadline covers all the attempts
+    message = str(error).lower()
+    return any(marker in message for marker in RETRYABLE_MARKERS)
+
+
+AGENT_DEADLINES = {agent: float(seconds) for agent, seconds in parse_pairs(LLM_AGENT_DEADLINES).items()}
+HEDGE_MODELS = parse_pairs(LLM_HEDGE_MODELS)  # model -> faster model used for the hedged duplicate
+
+
+def agent_deadline(agent: str = None) -> float:
+    """Deadline in seconds of the LLM calls of an agent (LLM_AGENT_DEADLINES, else LLM_DEADLINE_S)."""
+    return AGENT_DEADLINES.get(agent, LLM_DEADLINE_S)
+
+
+class CortexBackend(LLMBackend):
+    """Snowflake Cortex COMPLETE with deadlines, hedging and retries.
+
+    Queries are submitted with execute_async so a call past its deadline can
+    be cancelled with SYSTEM$CANCEL_QUERY instead of holding the warehouse.
+    When hedge_percentile is set and a call is slower than that percentile of
+    the recent latencies of its model, a duplicate is sent (to the model of
+    HEDGE_MODELS when there is one) and the first answer wins; the loser is
+    cancelled. Throttling and transient errors are retried with exponential
+    backoff and jitter, permanent errors are raised at once. Every query,
+    hedged duplicates included, waits for a slot of the shared client
+    (connectors.async_cortex), which enforces the concurrency cap and the
+    rate limit of the account.
+    """
+
+    name = "cortex"
+
+    def __init__(self, batch_size: int = CORTEX_BATCH_SIZE, hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE_S,
+                 backoff_max: float = LLM_BACKOFF_MAX_S):
+        self.batch_size = max(1, batch_size)
+        self.hedge_percentile = hedge_percentile
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=CORTEX_MAX_CONCURRENCY * 2, thread_name_prefix="cortex-hedge")
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.timeouts = 0
+
+    def complete(self, model: str, prompt: str, timeout: float = None) -> str:
+        deadline = time.monotonic() + (timeout or LLM_DEADLINE_S)
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self._hedge_delay(model) is None:
+                    return self._query_one(model, prompt, deadline)
+                return self._hedged(model, prompt, deadline)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                self.retries += 1
+                print(f"Cortex throttled or unavailable ({str(e)[:100]}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _query_one(self, model: str, prompt: str, deadline: float, cancel: threading.Event = None) -> str:
+        start = time.monotonic()
+        rows = self._execute("SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, %s)", (model, prompt), deadline, cancel)
+        if rows is None:
+            return None  # Cancelled: another attempt won
+        with self._lock:
+            self._latencies[model].append(time.monotonic() - start)
+        return rows[0][0] if rows and rows[0][0] else None
+
+    def _hedge_delay(self, model: str) -> float:
+        """Latency percentile of model after which a duplicate is sent, None when hedging is off."""
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies[model])
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))]
+
+    def _hedged(self, model: str, prompt: str, deadline: float) -> str:
+        hedge_model = HEDGE_MODELS.get(model, model)
+        cancels = [threading.Event(), threading.Event()]
+        futures = [self._executor.submit(self._query_one, model, prompt, deadline, cancels[0])]
+        done, _ = wait(futures, timeout=max(0.0, min(self._hedge_delay(model), deadline - time.monotonic())))
+        if not done:
+            self.hedges += 1
+            futures.append(self._executor.submit(self._query_one, hedge_model, prompt, deadline, cancels[1]))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                # First answer wins: cancel the other query
+                for other, cancel in zip(futures, cancels):
+                    if other is not future:
+                        cancel.set()
+                if future is not futures[0]:
+                    self.hedge_wins += 1
+                return result
+        raise error
+
+    def _execute(self, sql: str, params, deadline: float, cancel: threading.Event = None, requests: int = 1) -> list:
+        """Run sql asynchronously; cancel it by query ID on deadline or when cancel is set (returns None).
+
+        requests is the number of completions of the query, taken from the rate limit.
+        """
+        with async_cortex.slot(requests, deadline):
+            if cancel is not None and cancel.is_set():
+                return None  # The other attempt won while this one waited for a slot
+            return self._execute_query(sql, params, deadline, cancel)
+
+    def _execute_query(self, sql: str, params, deadline: float, cancel: threading.Event = None) -> list:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute_async(sql, params)
+                query_id = cursor.sfqid
+                poll = 0.05
+                while conn.is_still_running(conn.get_query_status_throw_if_error(query_id)):
+                    if cancel is not None and cancel.is_set():
+                        self._cancel(conn, query_id)
+                        return None
+                    if time.monotonic() >= deadline:
+                        self._cancel(conn, query_id)
+                        self.timeouts += 1
+                        raise LLMTimeoutError(f"Cortex query {query_id} cancelled after its deadline")
+                    time.sleep(min(poll, max(0.0, deadline - time.monotonic())))
+                    poll = min(poll * 2, 0.5)
+                cursor.get_results_from_sfqid(query_id)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def _cancel(conn, query_id: str) -> None:
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT SYSTEM$CANCEL_QUERY(%s)", (query_id,))
+            finally:
+                cursor.close()
+        except Exception as e:
+            print(f"Could not cancel Cortex query {query_id}: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            p50 = {model: sorted(lat)[len(lat) // 2] for model, lat in self._latencies.items() if lat}
+        return {"hedges": self.hedges, "hedge_wins": self.hedge_wins, "retries": self.retries,
+                "timeouts": self.timeouts, "latency_p50_s": p50}
+
+    def complete_batch(self, requests: list, timeout: float = None) -> list:
+        """One COMPLETE query per batch_size prompts.
+
+        TRY_COMPLETE returns NULL instead of failing the whole query, so a
+        prompt that fails only gives None at its position.
+        """
+        results = [None] * len(requests)
+        for start in range(0, len(requests), self.batch_size):
+            chunk = list(enumerate(requests[start:start + self.batch_size], start))
+            models = sorted({model for _, (model, _) in chunk})
+
+            # The model must be a constant: one SELECT per model over the same VALUES list
+            values = ", ".join(["(%s, %s, %s)"] * len(chunk))
+            selects = " UNION ALL ".join(
+                ["SELECT idx, SNOWFLAKE.CORTEX.TRY_COMPLETE(%s, prompt) FROM prompts WHERE model = %s"] * len(models)
+            )
+            sql = f"WITH prompts(idx, model, prompt) AS (SELECT * FROM VALUES {values}) {selects}"
+            params = [value for idx, (model, prompt) in chunk for value in (idx, model, prompt)]
+            params += [value for model in models for value in (model, model)]
+
+            deadline = time.monotonic() + (timeout or LLM_DEADLINE_S)
+            rows = None
+            for attempt in range(self.max_retries + 1):
+                try:
+                    rows = self._execute(sql, params, deadline, requests=len(chunk))
+                    break
+                except Exception as e:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    if attempt == self.max_retries or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                        print(f"Error querying Snowflake Cortex for prompts {start}-{start + len(chunk) - 1}: {str(e)}")
+                        break
+                    self.retries += 1
+                    time.sleep(delay)
+            if rows is None:
+                continue
+
+            for idx, response in rows:
+                results[int(idx)] = response or None
+        return results
+
+
+def cassette_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class RecordingBackend(LLMBackend):
+    """Forward to inner and save every non-empty response as a cassette."""
+
+    name = "record"
+
+    def __init__(self, inner: LLMBackend, cassette_dir: str = LLM_CASSETTE_DIR):
+        self.inner = inner
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+
+    def complete(self, model: str, prompt: str, timeout: float = None) -> str:
+        start = time.perf_counter()
+        response = self.inner.complete(model, prompt, timeout)
+        self._save(model, prompt, response, time.perf_counter() - start)
+        return response
+
+    def complete_batch(self, requests: list, timeout: float = None) -> list:
+        start = time.perf_counter()
+        responses = self.inner.complete_batch(requests, timeout)
+        # The batch latency is shared between its prompts
+        latency = (time.perf_counter() - start) / max(1, len(requests))
+        for (model, prompt), response in zip(requests, responses):
+            self._save(model, prompt, response, latency)
+        return responses
+
+    def _save(self, model: str, prompt: str, response: str, latency_s: float) -> None:
+        if response is None:
+            return
+        cassette = {"model": model, "prompt": prompt, "response": response, "latency_s": round(latency_s, 3)}
+        path = os.path.join(self.cassette_dir, cassette_key(model, prompt) + ".json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cassette, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+class ReplayBackend(LLMBackend):
+    """Serve recorded responses offline; latency is seconds per call or "recorded" (deadlines are ignored)."""
+
+    name = "replay"
+
+    def __init__(self, cassette_dir: str = LLM_CASSETTE_DIR, latency=LLM_REPLAY_LATENCY):
+        self.cassette_dir = cassette_dir
+        self.latency = latency
+        self.hits = 0
+        self.misses = 0
+
+    def complete(self, model: str, prompt: str, timeout: float = None) -> str:
+        path = os.path.join(self.cassette_dir, cassette_key(model, prompt) + ".json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                cassette = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            raise CassetteMiss(f"No recorded response for {model} prompt {prompt[:80]!r} in {self.cassette_dir}")
+        self.hits += 1
+
+        delay = cassette.get("latency_s", 0.0) if self.latency == "recorded" else float(self.latency or 0)
+        if delay:
+            time.sleep(delay)
+        return cassette["response"]
+
+
+class CachingBackend(LLMBackend):
+    """Look prompts up in a CompletionCache before forwarding them to inner."""
+
+    name = "cache"
+
+    def __init__(self, inner: LLMBackend, cache: CompletionCache = None):
+        self.inner = inner
+        self.cache = cache or CompletionCache()
+
+    def complete(self, model: str, prompt: str, timeout: float = None) -> str:
+        response = self.cache.get(model, prompt)
+        if response is None:
+            response = self.inner.complete(model, prompt, timeout)
+            self.cache.put(model, prompt, response)
+        return response
+
+    def complete_batch(self, requests: list, timeout: float = None) -> list:
+        results = [self.cache.get(model, prompt) for model, prompt in requests]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            responses = self.inner.complete_batch([requests[i] for i in missing], timeout)
+            for i, response in zip(missing, responses):
+                results[i] = response
+                self.cache.put(*requests[i], response)
+        return results
+
+
+def create_llm_backend(kind: str = LLM_BACKEND) -> LLMBackend:
+    if kind == "cortex":
+        # Not with record: every prompt must reach Cortex to be saved as a cassette
+        return CachingBackend(CortexBackend()) if LLM_CACHE_ENABLED else CortexBackend()
+    if kind == "record":
+        return RecordingBackend(CortexBackend())
+    if kind == "replay":
+        return ReplayBackend()
+    raise ValueError(f"Unknown LLM backend {kind!r} (expected cortex, record or replay)")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_llm_backend(cache: bool = True) -> LLMBackend:
+    """Configured backend; cache=False skips the completion cache for this call."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_llm_backend()
+    return _backend if cache else uncached(_backend)
+
+
+def uncached(backend: LLMBackend) -> LLMBackend:
+    """backend without its completion cache, for prompts whose answer must not be kept (retries)."""
+    return backend.inner if isinstance(backend, CachingBackend) else backend
+
+
+def discard_response(model: str, prompt: str, backend: LLMBackend = None) -> None:
+    """Drop the cached answer of model to prompt after the caller rejected it."""
+    backend = backend or get_llm_backend()
+    if isinstance(backend, CachingBackend):
+        backend.cache.discard(model, prompt)
+
+
+def completion_cache_stats() -> dict:
+    """Hit-rate statistics of the completion cache, None when it is not in use."""
+    backend = get_llm_backend()
+    return backend.cache.stats() if isinstance(backend, CachingBackend) else None
+
+
+def set_llm_backend(backend: LLMBackend) -> None:
+    global _backend
+    _backend = backend
@@ -0,0 +1,145 @@
+"""
+Per-call choice of the Cortex model, from the task, the prompt size and the
+context windows of the models.
+
+Tasks:
+- decision: one-word answer of the orchestrator;
+- explanation: explanation of a validation error, prompt for another agent;
+- fragment: correction or edit of one XML fragment;
+- document: edit of a whole XML document.
+
+By default (baseline policy) each task keeps the model the agents were
+tuned with, BASELINE_MODELS, and another model is only chosen when the prompt
+does not fit its context window. The cost, latency and quality policies are
+opt-in: among the models of LLM_ROUTER_MODELS of the task's minimum tier or
+above whose context window holds the prompt and the expected answer, they
+pick the cheapest, the fastest or the strongest. When an answer cannot be
+parsed or validated, escalate() gives the baseline model of the task, then
+the next stronger model that fits.
+"""
+from dataclasses import dataclass
+
+from config import LLM_ROUTER_MODELS, LLM_ROUTING_POLICY, LLM_TASK_MODELS
+from utils.config_values import parse_pairs
+
+
+@dataclass(frozen=True)
+class ModelProfile:
+    name: str               # Cortex model name
+    context_tokens: int     # Context window
+    tier: int               # 1 = small, 2 = mid-size, 3 = frontier
+    cost: float             # Approximate credits per million tokens
+    latency: int            # Relative latency rank, 1 = fastest
+    deprecated: bool = False  # Retired by Cortex, never routed to
+
+
+# Approximate figures from the Cortex documentation, for ranking only
+MODEL_PROFILES = {p.name: p for p in (
+    ModelProfile("claude-3-5-sonnet", 18000, 3, 2.55, 3),
+    ModelProfile("mistral-large2", 128000, 3, 1.95, 3),
+    ModelProfile("mistral-large", 32000, 3, 5.10, 3),
+    ModelProfile("llama3.1-405b", 128000, 3, 3.00, 3),
+    ModelProfile("snowflake-llama-3.1-405b", 8000, 3, 0.96, 2),
+    ModelProfile("reka-core", 32000, 3, 5.50, 3),
+    ModelProfile("llama4-maverick", 128000, 3, 0.25, 2),
+    ModelProfile("llama3.3-70b", 128000, 2, 1.21, 2),
+    ModelProfile("snowflake-llama-3.3-70b", 8000, 2, 0.29, 1),
+    ModelProfile("llama3.1-70b", 128000, 2, 1.21, 2),
+    ModelProfile("llama3-70b", 8000, 2, 1.21, 2, deprecated=True),
+    ModelProfile("llama2-70b-chat", 4096, 2, 0.45, 2, deprecated=True),
+    ModelProfile("jamba-1.5-large", 256000, 2, 1.40, 2),
+    ModelProfile("mixtral-8x7b", 32000, 2, 0.22, 1),
+    ModelProfile("reka-flash", 100000, 2, 0.45, 1),
+    ModelProfile("snowflake-arctic", 4096, 2, 0.84, 1),
+    ModelProfile("jamba-instruct", 256000, 1, 0.83, 1),
+    ModelProfile("jamba-1.5-mini", 256000, 1, 0.10, 1),
+    ModelProfile("llama3.1-8b", 128000, 1, 0.19, 1),
+    ModelProfile("llama3-8b", 8000, 1, 0.19, 1, deprecated=True),
+    ModelProfile("llama3.2-3b", 128000, 1, 0.06, 1),
+    ModelProfile("llama3.2-1b", 128000, 1, 0.04, 1),
+    ModelProfile("mistral-7b", 32000, 1, 0.12, 1),
+    ModelProfile("gemma-7b", 8000, 1, 0.12, 1, deprecated=True),
+)}
+
+# Models of the agents before routing: kept by the baseline policy, first escalation target
+BASELINE_MODELS = {
+    "decision": "claude-3-5-sonnet",
+    "explanation": "mistral-large",
+    "fragment": "claude-3-5-sonnet",
+    "document": "claude-3-5-sonnet",
+}
+
+TASK_MIN_TIER = {"decision": 2, "explanation": 2, "fragment": 2, "document": 3}
+# Expected answer size: fixed tokens, or a multiple of the prompt for edits that return the XML
+TASK_OUTPUT_TOKENS = {"decision": 16, "explanation": 1024}
+TASK_OUTPUT_RATIO = {"fragment": 1.2, "document": 1.1}
+CHARS_PER_TOKEN = 3  # XML tokenizes more densely than prose
+
+POLICIES = {
+    "cost": lambda p: (p.cost, p.latency, -p.tier),
+    "latency": lambda p: (p.latency, p.cost, -p.tier),
+    "quality": lambda p: (-p.tier, p.cost, p.latency),
+}
+
+
+TASK_MODELS = parse_pairs(LLM_TASK_MODELS)  # task -> pinned model
+# Models the account is known to have: the listed ones, by default those the agents already use
+ROUTER_MODELS = [m.strip() for m in LLM_ROUTER_MODELS.split(",") if m.strip()] or list(dict.fromkeys(BASELINE_MODELS.values()))
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _required_tokens(task: str, prompt_tokens: int) -> int:
+    output = TASK_OUTPUT_TOKENS.get(task) or int(prompt_tokens * TASK_OUTPUT_RATIO.get(task, 1.0))
+    return prompt_tokens + output
+
+
+def _fits(model: str, task: str, prompt: str) -> bool:
+    profile = MODEL_PROFILES.get(model)
+    return profile is None or profile.context_tokens >= _required_tokens(task, estimate_tokens(prompt))
+
+
+def candidates(task: str, prompt: str, policy: str = LLM_ROUTING_POLICY) -> list:
+    """Models of ROUTER_MODELS able to do task on prompt, best first according to policy."""
+    if task not in TASK_MIN_TIER:
+        raise ValueError(f"Unknown LLM task {task!r} (expected one of {', '.join(TASK_MIN_TIER)})")
+    needed = _required_tokens(task, estimate_tokens(prompt))
+    profiles = [MODEL_PROFILES[m] for m in ROUTER_MODELS if m in MODEL_PROFILES and not MODEL_PROFILES[m].deprecated]
+    fitting = [p for p in profiles if p.context_tokens >= needed]
+    eligible = [p for p in fitting if p.tier >= TASK_MIN_TIER[task]]
+    if not eligible:
+        # Nothing strong enough holds the prompt: take the largest contexts
+        eligible = sorted(fitting or profiles, key=lambda p: -p.context_tokens)[:1]
+    return [p.name for p in sorted(eligible, key=POLICIES.get(policy, POLICIES["quality"]))]
+
+
+def route(task: str, prompt: str, policy: str = LLM_ROUTING_POLICY, baseline: str = None) -> str:
+    """Model for one call; LLM_TASK_MODELS pins a model per task.
+
+    baseline replaces the task's BASELINE_MODELS entry for a caller that used
+    another model before routing.
+    """
+    if task in TASK_MODELS:
+        return TASK_MODELS[task]
+    baseline = baseline or BASELINE_MODELS.get(task)
+    if policy == "baseline" and baseline and _fits(baseline, task, prompt):
+        return baseline
+    return candidates(task, prompt, policy)[0]
+
+
+def escalate(model: str, task: str, prompt: str) -> str:
+    """Stronger model for a failed call: the task's baseline model, then the
+    cheapest model of the next stronger tier that fits; None when there is none."""
+    current = MODEL_PROFILES.get(model)
+    current_tier = current.tier if current else 0
+    baseline = BASELINE_MODELS.get(task)
+    baseline_profile = MODEL_PROFILES.get(baseline)
+    if model != baseline and baseline_profile and baseline_profile.tier >= current_tier and _fits(baseline, task, prompt):
+        return baseline
+    stronger = [m for m in candidates(task, prompt, "quality") if MODEL_PROFILES[m].tier > current_tier]
+    if not stronger:
+        return None
+    next_tier = min(MODEL_PROFILES[m].tier for m in stronger)
+    return min((m for m in stronger if MODEL_PROFILES[m].tier == next_tier), key=lambda m: MODEL_PROFILES[m].cost)
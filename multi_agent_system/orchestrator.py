@@ -1,26 +1,35 @@
 from utils.xml_utils import extract_instructions_from_file
-from connectors.snowflake_conn import get_snowflake_connection
+from connectors.cortex_llm import complete_routed
 from agent_corrector import corrector_agent
 from agent_validator import agent_validator
 from agent_modifier import agent_modifier
+from utils.xml_document import XmlDocument
 
+DECISIONS = ("correction", "modification", "stop")
 
-def call_corrector_agent(xml_file_path, suggestion, xpath):
+
+def is_decision(response: str) -> bool:
+    """The orchestrator answer starts with one of the decisions."""
+    words = response.strip().lower().split()
+    return bool(words) and words[0] in DECISIONS
+
+
+def call_corrector_agent(document, suggestion, xpath):
     print("🛠️ Appel à l'agent correcteur")
-    xml_file_correct_path = corrector_agent(xml_file_path, suggestion, xpath)
-    return xml_file_correct_path
+    corrected_document = corrector_agent(document, suggestion, xpath)
+    return corrected_document or document
 
 
-def call_modifier_agent(xml_file_path, instructions):
+def call_modifier_agent(document, instructions):
     print("📝 Appel à l'agent modificateur")
-    agent_modifier(xml_file_path, instructions)
-    return xml_file_path
+    agent_modifier(document, instructions)
+    return document
 
 
-def orchestrator_llm(status, suggestions, instructions, xml_file_path, xpath, has_been_modified):
+def orchestrator_llm(status, suggestions, instructions, document, xpath, has_been_modified):
     # Nettoyage des entrées
-    status_clean = status.replace("'", "''").replace("\n", " ").replace("\r", " ") if status else ""
-    suggestions_clean = suggestions.replace("'", "''").replace("\n", " ").replace("\r", " ") if suggestions else ""
+    status_clean = status.replace("\n", " ").replace("\r", " ") if status else ""
+    suggestions_clean = suggestions.replace("\n", " ").replace("\r", " ") if suggestions else ""
 
     prompt = f"""
     Vous êtes un agent orchestrateur responsable de vérifier, corriger et modifier un fichier XML.
@@ -41,36 +50,25 @@ def orchestrator_llm(status, suggestions, instructions, xml_file_path, xpath, ha
     """
 
     try:
-        conn = get_snowflake_connection()
-        cursor = conn.cursor()
+        # The answer must start with one of the three decisions, otherwise a stronger model is asked
+        response = complete_routed("decision", prompt, validate=is_decision, agent="orchestrator")
 
-        sql = """
-        SELECT SNOWFLAKE.cortex.COMPLETE(
-            'claude-3-5-sonnet',
-            '{}'
-        )
-        """.format(prompt)
-
-        cursor.execute(sql)
-        result = cursor.fetchone()
-
-        if result and result[0]:
-            response = result[0]
+        if response:
             decision = response.strip().lower().split()[0]
             print(f" Décision extraite de l'agent orchestrateur : {decision}")
 
             if decision == "correction":
                 print("❌ Correction requise.")
-                xml_file_path = call_corrector_agent(xml_file_path, suggestions, xpath)
+                document = call_corrector_agent(document, suggestions, xpath)
             elif decision == "modification":
                 print("✅ Modification requise.")
-                xml_file_path = call_modifier_agent(xml_file_path, instructions)
+                document = call_modifier_agent(document, instructions)
             elif decision == "stop":
                 print("🛑 Le fichier est valide et a été modifié. Arrêt du pipeline.")
             else:
                 raise ValueError(f"Décision inattendue de Mistral : {decision}")
 
-            return xml_file_path, decision
+            return document, decision
         else:
             raise ValueError("Aucune réponse obtenue de Mistral")
 
@@ -80,12 +78,6 @@ def orchestrator_llm(status, suggestions, instructions, xml_file_path, xpath, ha
         print(traceback.format_exc())
         raise RuntimeError(f"Échec de l'agent orchestrateur : {str(e)}")
 
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
-
 """
 if __name__ == "__main__":
 
@@ -104,17 +96,20 @@ if __name__ == "__main__":
     instructions = prompt # with prompt
     should_continue = True
     has_been_modified = False
+    document = XmlDocument.load(xml_file_path)
 
     while should_continue:
-        print(f"🔍 Validation du fichier : {xml_file_path}")
-        status, suggestions, xpath = agent_validator(xml_file_path)
+        print(f"🔍 Validation du fichier : {document.path}")
+        status, suggestions, xpath = agent_validator(document)
 
-        xml_file_path, decision = orchestrator_llm(
-            status, suggestions, instructions, xml_file_path, xpath, has_been_modified
+        document, decision = orchestrator_llm(
+            status, suggestions, instructions, document, xpath, has_been_modified
         )
         if decision == "modification":
             has_been_modified = True
         elif decision == "stop":
             should_continue = False
 
+    # Single write of the document, once the pipeline is done
+    xml_file_path = document.save(f"corrected_files/{document.filename}")
     print(f"\n✅ Le fichier XML final est valide et prêt : {xml_file_path}")"""
\ No newline at end of file
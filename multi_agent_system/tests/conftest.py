@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The modules are imported as in the application, from the multi_agent_system directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+SAMPLE_DM = os.path.join(
+    BASE_DIR, "data", "TC1_additions_1", "base_documents", "DMC-BRAKE-AAA-DA1-00-00-00AA-341A-A_002-00_en-US.XML"
+)
+
+
+@pytest.fixture
+def document():
+    """The sample procedural data module, parsed (valid apart from three missing dmCode attributes)."""
+    from utils.xml_document import XmlDocument
+    document = XmlDocument.load(SAMPLE_DM)
+    document.tree
+    return document
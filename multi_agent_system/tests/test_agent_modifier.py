@@ -0,0 +1,25 @@
+import lxml.etree as lxmlET
+
+
+class RejectedBackend:
+    def __init__(self):
+        self.models = []
+
+    def complete(self, model, prompt, timeout=None):
+        self.models.append(model)
+        return "not xml"
+
+
+def test_focused_repairs_share_one_budget(monkeypatch):
+    import agent_modifier
+
+    monkeypatch.setattr(agent_modifier, "FRAGMENT_VALIDATION_RETRIES", 2)
+    monkeypatch.setattr(agent_modifier, "route", lambda task, prompt: "mixtral-8x7b")
+    backend = RejectedBackend()
+    modifier = agent_modifier.ModifierAgent(backend=backend)
+    xml_str = "<root><a>text</a></root>"
+
+    result = modifier.process_focused(xml_str, lxmlET.fromstring(xml_str), "change a", "modification", "/root/a")
+
+    assert result is None
+    assert backend.models == ["mixtral-8x7b", "claude-3-5-sonnet", "claude-3-5-sonnet"]
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+
+from connectors.async_cortex import AsyncCortexClient
+
+
+def test_slots_cap_the_queries_of_every_thread():
+    client = AsyncCortexClient(max_concurrency=2, rate_per_min=0)
+    lock = threading.Lock()
+    in_flight = []
+    peak = []
+
+    def query():
+        with client.slot():
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.pop()
+
+    threads = [threading.Thread(target=query) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+
+
+def test_rate_limit_delays_requests_beyond_the_burst():
+    client = AsyncCortexClient(max_concurrency=4, rate_per_min=600, burst=2)  # 10 requests per second
+
+    start = time.monotonic()
+    for _ in range(3):
+        with client.slot():
+            pass
+
+    assert time.monotonic() - start >= 0.09
+    assert client.throttled_s > 0
+
+
+def test_failed_completions_give_none():
+    def complete_fn(model, prompt, agent=None):
+        if prompt == "bad":
+            raise RuntimeError("Cortex error")
+        return f"{model}:{prompt}:{agent}"
+
+    client = AsyncCortexClient(complete_fn=complete_fn, rate_per_min=0)
+
+    results = asyncio.run(client.complete_many([("m", "ok"), ("m", "bad")], agent="corrector"))
+
+    assert results == ["m:ok:corrector", None]
+    assert client.stats()["failed"] == 1
+
+
+def test_rate_limit_wait_respects_the_deadline_without_a_slot():
+    client = AsyncCortexClient(max_concurrency=1, rate_per_min=60, burst=1)  # 1 request per second
+    with client.slot():
+        pass
+
+    start = time.monotonic()
+    try:
+        with client.slot(deadline=time.monotonic() + 0.1):
+            raise AssertionError("the slot was given past the deadline")
+    except TimeoutError:
+        pass
+
+    assert time.monotonic() - start < 0.1  # Raised at once instead of sleeping
+    assert client._slots.acquire(blocking=False)  # The throttled caller held no slot
+    client._slots.release()
@@ -0,0 +1,23 @@
+from connectors.connection_pool import SnowflakeConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+def test_connections_released_after_close_all_are_closed():
+    pool = SnowflakeConnectionPool(connection_factory=FakeConnection, size=2)
+
+    with pool.connection() as checked_out:
+        pool.close_all()
+        assert not checked_out.closed
+
+    assert checked_out.closed
+    assert pool.stats()["open"] == 0
@@ -0,0 +1,109 @@
+import pytest
+
+from connectors.cortex_llm import complete_routed
+from connectors.llm_backend import CassetteMiss
+
+
+class MissingBackend:
+    def __init__(self):
+        self.models = []
+
+    def complete(self, model, prompt, timeout=None):
+        self.models.append(model)
+        raise CassetteMiss(prompt)
+
+
+def test_cassette_miss_is_not_escalated():
+    backend = MissingBackend()
+
+    with pytest.raises(CassetteMiss):
+        complete_routed("fragment", "prompt", backend=backend, model="mistral-large")
+
+    assert backend.models == ["mistral-large"]
+
+
+class ScriptedBackend:
+    """Answers the multi-fragment prompt without F2, then corrects F2 alone."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, model, prompt, timeout=None):
+        self.prompts.append(prompt)
+        if "=== FRAGMENT" in prompt:
+            return "=== FRAGMENT F1 ===\n<a>fixed</a>\n=== END F1 ==="
+        return "<b>fixed</b>"
+
+
+def test_corrector_retries_a_missing_fragment_through_the_shared_client(monkeypatch):
+    from lxml import etree
+
+    from connectors import async_cortex, llm_backend
+    from connectors.cortex_llm import correct_with_llm
+
+    backend = ScriptedBackend()
+    monkeypatch.setattr(llm_backend, "_backend", backend)
+    completed = async_cortex.async_cortex.completed
+    tree = etree.ElementTree(etree.fromstring("<root><a>broken</a><b>broken</b></root>"))
+
+    result = correct_with_llm(tree, "fix", ["/root/a", "/root/b"])
+
+    assert "<a>fixed</a>" in result and "<b>fixed</b>" in result
+    assert len(backend.prompts) == 2
+    assert async_cortex.async_cortex.completed == completed + 2
+
+
+class RejectedBackend:
+    def __init__(self):
+        self.models = []
+
+    def complete(self, model, prompt, timeout=None):
+        self.models.append(model)
+        return "not xml"
+
+
+def test_fragment_retries_share_one_budget(monkeypatch):
+    from connectors import cortex_llm, llm_backend
+
+    backend = RejectedBackend()
+    monkeypatch.setattr(llm_backend, "_backend", backend)
+    monkeypatch.setattr(cortex_llm, "FRAGMENT_VALIDATION_RETRIES", 3)
+
+    cortex_llm._correct_alone("fix", "<a/>", "/root/a", "mixtral-8x7b")
+
+    assert backend.models == ["mixtral-8x7b", "claude-3-5-sonnet", "claude-3-5-sonnet"]
+
+
+def test_rejected_answers_are_not_kept_in_the_cache(tmp_path, monkeypatch):
+    from connectors import cortex_llm, llm_backend
+    from connectors.completion_cache import CompletionCache
+
+    inner = RejectedBackend()
+    cache = CompletionCache(str(tmp_path / "completions.db"))
+    backend = llm_backend.CachingBackend(inner, cache)
+    monkeypatch.setattr(llm_backend, "_backend", backend)
+
+    assert complete_routed("decision", "decide", validate=lambda output: output == "stop") == "not xml"
+    cortex_llm._correct_alone("fix", "<a/>", "/root/a", "claude-3-5-sonnet")
+    cortex_llm._correct_alone("fix", "<a/>", "/root/a", "claude-3-5-sonnet", output="<a>", problems=["bad"])
+    assert cache.stats()["entries"] == 0
+
+    assert complete_routed("decision", "decide") == "not xml"
+    assert cache.get("claude-3-5-sonnet", "decide") == "not xml"
+
+
+def test_cassette_miss_fails_the_batch_and_concurrent_paths(tmp_path, monkeypatch):
+    from lxml import etree
+
+    from connectors import cortex_llm, llm_backend
+    from connectors.cortex_llm import complete_batch, correct_with_llm
+
+    monkeypatch.setattr(llm_backend, "_backend", llm_backend.ReplayBackend(str(tmp_path)))
+    tree = etree.ElementTree(etree.fromstring("<root><a>broken</a></root>"))
+
+    with pytest.raises(CassetteMiss):
+        complete_batch([("mistral-large", "prompt")])
+    with pytest.raises(CassetteMiss):
+        correct_with_llm(tree, "fix", ["/root/a"])
+    with pytest.raises(CassetteMiss):
+        cortex_llm._correct_alone("fix", "<a/>", "/root/a", "mistral-large")
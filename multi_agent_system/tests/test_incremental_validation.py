@@ -0,0 +1,39 @@
+import utils.incremental_validation as incremental_validation
+from utils.incremental_validation import ChangedSubtree, validate_document
+
+
+def test_one_changed_subtree_is_revalidated_alone(document, monkeypatch, capsys):
+    assert len(validate_document(document)) == 3
+
+    def full_validation(*args, **kwargs):
+        raise AssertionError("the whole document was revalidated")
+
+    monkeypatch.setattr(incremental_validation, "validate_xml_records", full_validation)
+    dm_status = document.tree.xpath("//dmStatus")[0]
+    dm_status.set("issueType", "New")
+    document.mark_changed([ChangedSubtree(document.tree.getpath(dm_status))])
+
+    records = validate_document(document)
+
+    assert "Revalidation incrémentale de 1 sous-arbre(s)." in capsys.readouterr().out
+    assert sorted(r.kind for r in records) == ["invalid_enumeration"] + ["missing_attribute"] * 3
+
+
+def test_renamed_subtree_with_ids_is_revalidated_in_full(document, monkeypatch):
+    step = document.tree.xpath("//proceduralStep")[0]
+    step.set("id", "stp-0001")
+    validate_document(document)
+
+    full_passes = []
+
+    def full_validation(*args, **kwargs):
+        full_passes.append(args)
+        return []
+
+    monkeypatch.setattr(incremental_validation, "validate_xml_records", full_validation)
+    step.tag = "levelledPara"  # Same ID value, on an element that may type it differently
+    document.mark_changed([ChangedSubtree(document.tree.getpath(step), tag_changed=True)])
+
+    validate_document(document)
+
+    assert len(full_passes) == 1
@@ -0,0 +1,21 @@
+from connectors import model_router
+from connectors.model_router import BASELINE_MODELS, escalate, route
+
+
+def test_baseline_policy_keeps_the_model_of_each_task():
+    for task, model in BASELINE_MODELS.items():
+        assert route(task, "short prompt", "baseline") == model
+
+
+def test_baseline_model_is_replaced_only_when_the_prompt_does_not_fit():
+    prompt = "<x/>" * 20000  # Beyond the context window of claude-3-5-sonnet
+
+    assert route("document", prompt, "baseline") == "mistral-large"
+
+
+def test_escalation_reaches_the_baseline_model(monkeypatch):
+    monkeypatch.setattr(model_router, "ROUTER_MODELS", list(model_router.MODEL_PROFILES))
+
+    model = route("fragment", "short prompt", "cost")
+    assert not model_router.MODEL_PROFILES[model].deprecated
+    assert escalate(model, "fragment", "short prompt") == "claude-3-5-sonnet"
@@ -0,0 +1,50 @@
+import shutil
+
+import agent_validator as validator_module
+from utils import rule_fixers
+from utils.rule_fixers import apply_rule_fixers
+from utils.incremental_validation import validate_document
+from utils.xml_document import XmlDocument
+from tests.conftest import SAMPLE_DM
+
+DM_CODE_DEFAULTS = {"assyCode": "00", "disassyCode": "00", "disassyCodeVariant": "A"}
+
+
+def test_attribute_enumeration_typo_is_fixed(document):
+    dm_status = document.tree.xpath("//dmStatus")[0]
+    dm_status.set("issueType", "New")
+
+    records = apply_rule_fixers(document, validate_document(document))
+
+    assert dm_status.get("issueType") == "new"
+    assert {r.kind for r in records} == {"missing_attribute"}
+
+
+def test_children_of_a_repeated_choice_model_are_reordered(document):
+    dm_status = document.tree.xpath("//dmStatus")[0]
+    dm_status.insert(0, dm_status.find("skillLevel"))
+
+    records = apply_rule_fixers(document, validate_document(document))
+
+    assert [child.tag for child in dm_status][-3:] == ["systemBreakdownCode", "skillLevel", "reasonForUpdate"]
+    assert {r.kind for r in records} == {"missing_attribute"}
+
+
+def test_a_fix_that_leaves_the_error_is_undone(document, monkeypatch):
+    monkeypatch.setattr(rule_fixers, "ATTRIBUTE_DEFAULTS", {"assyCode": "not a code"})
+    dm_code = document.tree.xpath("//dmCode")[0]
+
+    records = apply_rule_fixers(document, validate_document(document))
+
+    assert dm_code.get("assyCode") is None
+    assert len(records) == 3
+
+
+def test_fixes_are_saved_when_the_validator_gets_a_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(rule_fixers, "ATTRIBUTE_DEFAULTS", DM_CODE_DEFAULTS)
+    monkeypatch.setattr(validator_module, "insert_error_to_snowflake", lambda *args: None)
+    xml_path = str(tmp_path / "dm.xml")
+    shutil.copy(SAMPLE_DM, xml_path)
+
+    assert validator_module.agent_validator(xml_path)[0] == "valid"
+    assert validate_document(XmlDocument.load(xml_path)) == []
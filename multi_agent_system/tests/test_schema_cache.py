@@ -0,0 +1,24 @@
+import pytest
+
+from utils.schema_cache import SchemaRegistry
+
+
+def test_failed_compilation_releases_its_key_lock(tmp_path):
+    schema_path = tmp_path / "dm.xsd"
+    schema_path.write_text("<xs:schema xmlns:xs='http://www.w3.org/2001/XMLSchema'/>")
+    attempts = []
+
+    def loader(path):
+        attempts.append(path)
+        if len(attempts) == 1:
+            raise ValueError("broken schema")
+        return "compiled"
+
+    registry = SchemaRegistry(loader=loader)
+
+    with pytest.raises(ValueError):
+        registry.get(str(schema_path))
+    assert registry._key_locks == {}
+
+    assert registry.get(str(schema_path)) == "compiled"
+    assert registry._key_locks == {}
@@ -0,0 +1,36 @@
+from utils.xml_utils import validate_xml_records
+
+
+def test_attribute_value_errors_name_the_attribute(document):
+    document.tree.xpath("//dmStatus")[0].set("issueType", "New")
+    document.tree.xpath("//dmCode")[0].set("modelIdentCode", "b")
+
+    records = {r.kind: r for r in validate_xml_records(document.path, document.tree)}
+
+    assert records["invalid_enumeration"].attribute == "issueType"
+    assert records["invalid_enumeration"].element == "dmStatus"
+    assert records["invalid_value"].attribute == "modelIdentCode"
+
+
+def test_missing_attributes_are_classified(document):
+    records = validate_xml_records(document.path, document.tree)
+
+    assert {(r.kind, r.attribute) for r in records} == {
+        ("missing_attribute", "assyCode"),
+        ("missing_attribute", "disassyCode"),
+        ("missing_attribute", "disassyCodeVariant"),
+    }
+
+
+def test_enumeration_signatures_keep_the_attribute(document):
+    from utils.validation_errors import error_signature
+
+    document.tree.xpath("//dmStatus")[0].set("issueType", "New")
+    first = [r for r in validate_xml_records(document.path, document.tree) if r.kind == "invalid_enumeration"]
+    document.tree.xpath("//dmStatus")[0].set("issueType", "Changed")
+    second = [r for r in validate_xml_records(document.path, document.tree) if r.kind == "invalid_enumeration"]
+
+    signature = error_signature(first[0])
+    assert signature.attribute == "issueType"
+    assert signature.to_text().startswith("<dmStatus> [invalid_enumeration] @issueType: ")
+    assert error_signature(second[0]) == signature
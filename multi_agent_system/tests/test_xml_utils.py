@@ -0,0 +1,52 @@
+from utils.xml_utils import iter_xml_records_streaming, validate_xml_records
+
+
+def test_streaming_records_match_the_tree_validation(document, tmp_path):
+    document.tree.xpath("//dmStatus")[0].set("issueType", "New")
+    document.tree.xpath("//proceduralStep")[1].set("bogus", "1")
+    xml_path = tmp_path / "dm.xml"
+    document.tree.write(str(xml_path), xml_declaration=True, encoding="utf-8")
+
+    expected = validate_xml_records(str(xml_path), document.tree)
+    streamed = list(iter_xml_records_streaming(str(xml_path)))
+
+    def key(r):
+        return r.kind, r.path, r.element, r.attribute
+
+    assert len(expected) == 5  # The three dmCode attributes, issueType and bogus
+    assert sorted(map(key, streamed)) == sorted(map(key, expected))
+    assert all(r.line is not None for r in streamed)
+
+
+def test_streaming_a_valid_file_yields_nothing(document, tmp_path):
+    for dm_code in document.tree.xpath("//dmCode"):
+        dm_code.set("assyCode", "00")
+        dm_code.set("disassyCode", "00")
+        dm_code.set("disassyCodeVariant", "A")
+    xml_path = tmp_path / "dm.xml"
+    document.tree.write(str(xml_path), xml_declaration=True, encoding="utf-8")
+
+    assert list(iter_xml_records_streaming(str(xml_path))) == []
+
+
+def test_streaming_reports_identity_errors_with_other_errors(document, tmp_path, monkeypatch):
+    from lxml import etree
+
+    from utils import xml_utils
+
+    steps = document.tree.xpath("//proceduralStep")
+    steps[0].set("id", "stp-0001")
+    steps[1].set("id", "stp-0001")
+    ref = etree.SubElement(document.tree.xpath("//proceduralStep/para")[0], "internalRef")
+    ref.set("internalRefId", "nowhere")
+    xml_path = tmp_path / "dm.xml"
+    document.tree.write(str(xml_path), xml_declaration=True, encoding="utf-8")
+
+    def key(r):
+        return r.kind, r.path, r.element, r.attribute, r.reason
+
+    expected = sorted(map(key, validate_xml_records(str(xml_path), etree.parse(str(xml_path)))))
+    assert any("duplicated xs:ID" in k[4] for k in expected) and any("IDREF" in k[4] for k in expected)
+    for fast_path in (True, False):
+        monkeypatch.setattr(xml_utils, "VALIDATION_FAST_PATH", fast_path)
+        assert sorted(map(key, iter_xml_records_streaming(str(xml_path)))) == expected
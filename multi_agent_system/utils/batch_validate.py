@@ -0,0 +1,113 @@
+"""
+Batch validation of whole data-module directories.
+
+Walks a directory tree, validates every XML file in a pool of worker
+processes and streams one JSON object per file (JSON Lines), followed by a
+throughput summary on stderr. Each worker keeps its compiled schemas for
+its whole life, so a schema is loaded at most once per worker.
+
+Usage:
+    python -m utils.batch_validate data/ --workers 8 --output results.jsonl
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict
+
+from lxml import etree
+
+from config import SCHEMA_DIR
+from utils.schema_cache import get_schema, libxml2_registry, schema_registry
+from utils.xml_utils import use_streaming_validation, validate_xml_records
+
+XML_EXTENSIONS = (".xml",)
+
+
+def iter_xml_files(root_dir: str):
+    """Yield every XML file below root_dir, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(XML_EXTENSIONS):
+                yield os.path.join(dirpath, filename)
+
+
+def _init_worker(schema_dir: str, preload: list) -> None:
+    """Keep every schema of schema_dir resident for the life of the worker."""
+    schema_count = len(glob.glob(os.path.join(schema_dir, "*.xsd")))
+    for registry in (schema_registry, libxml2_registry):
+        registry.maxsize = max(registry.maxsize, schema_count)
+    for name in preload:
+        get_schema(os.path.join(schema_dir, name))
+
+
+def validate_file(xml_path: str) -> dict:
+    """Validate one file and return its JSON-serialisable result."""
+    start = time.perf_counter()
+    result = {"file": xml_path, "size": os.path.getsize(xml_path)}
+    try:
+        # Above the streaming threshold the file is validated without building the tree
+        tree = None if use_streaming_validation(xml_path) else etree.parse(xml_path)
+        records = validate_xml_records(xml_path, tree)
+        result["status"] = "invalid" if records else "valid"
+        result["error_count"] = len(records)
+        result["errors"] = [asdict(record) for record in records]
+    except etree.XMLSyntaxError as e:
+        result["status"] = "syntax_error"
+        result["message"] = str(e)
+    except Exception as e:
+        result["status"] = "failed"
+        result["message"] = str(e)
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+def run_batch(root_dir: str, output, workers: int = None, schema_dir: str = SCHEMA_DIR, preload: list = ()) -> dict:
+    """Validate every XML file below root_dir and write JSON Lines to output."""
+    files = list(iter_xml_files(root_dir))
+    counts = {"valid": 0, "invalid": 0, "syntax_error": 0, "failed": 0}
+    total_bytes = 0
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(schema_dir, list(preload))) as executor:
+        futures = [executor.submit(validate_file, path) for path in files]
+        for future in as_completed(futures):
+            result = future.result()
+            counts[result["status"]] += 1
+            total_bytes += result["size"]
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "files": len(files),
+        **counts,
+        "elapsed_s": round(elapsed, 3),
+        "files_per_s": round(len(files) / elapsed, 2) if elapsed else 0.0,
+        "mb_per_s": round(total_bytes / (1024 * 1024) / elapsed, 3) if elapsed else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate every XML data module of a directory tree")
+    parser.add_argument("directory", help="Root directory containing the data modules")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--output", default=None, help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--schema-dir", default=SCHEMA_DIR, help="Directory containing the XSD files")
+    parser.add_argument("--preload", nargs="*", default=[], help="Schema file names each worker loads at startup, e.g. proced.xsd")
+    args = parser.parse_args()
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        summary = run_batch(args.directory, output, args.workers, args.schema_dir, args.preload)
+    finally:
+        if args.output:
+            output.close()
+
+    print(json.dumps({"summary": summary}), file=sys.stderr)
+    sys.exit(0 if summary["syntax_error"] == 0 and summary["failed"] == 0 else 1)
@@ -0,0 +1,13 @@
+"""
+Parsing of the structured settings of config.py.
+"""
+
+
+def parse_pairs(value: str) -> dict:
+    """Parse "key=value;key=value" entries from the environment."""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in value.split(";"))):
+        key, _, val = item.partition("=")
+        if key and val:
+            pairs[key.strip()] = val.strip()
+    return pairs
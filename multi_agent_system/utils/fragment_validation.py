@@ -0,0 +1,64 @@
+"""
+Schema validation of one XML fragment returned by the LLM, against the XSD
+declaration of the element it replaces, before it is merged into the
+document.
+
+Only the fragment is validated, with the compiled schema of the document
+(utils.schema_cache), so a bad answer is rejected in milliseconds and can be
+sent back to the LLM with its errors, instead of being found by the next
+full validation of the document.
+"""
+from itertools import islice
+
+from lxml import etree
+
+from config import FRAGMENT_VALIDATION_MAX_ERRORS
+from utils.incremental_validation import POSITION_PATTERN
+from utils.schema_cache import get_schema
+from utils.validation_errors import _local_name, record_from_error
+from utils.xml_utils import get_schema_path, schema_locations_from_root
+
+
+class FragmentValidator:
+    """Checks replacement fragments against the element declarations of a schema."""
+
+    def __init__(self, schema, namespaces: dict = None):
+        self.schema = schema
+        self.namespaces = namespaces or {}
+        self._declarations = {}
+
+    @classmethod
+    def for_root(cls, root, base_path: str = ""):
+        """Validator for the schema of the document of root; None when it cannot be resolved."""
+        try:
+            schema_locations = schema_locations_from_root(root)
+            if len(schema_locations) != 1:
+                return None
+            schema = get_schema(get_schema_path(schema_locations[0], base_path))
+        except Exception as e:
+            print(f"Validation des fragments désactivée : {e}")
+            return None
+        return cls(schema, {k: v for k, v in root.nsmap.items() if k is not None})
+
+    def declaration(self, schema_path: str):
+        if schema_path not in self._declarations:
+            self._declarations[schema_path] = self.schema.find(schema_path, namespaces=self.namespaces)
+        return self._declarations[schema_path]
+
+    def errors(self, fragment_xml: str, path: str) -> list:
+        """Problems of fragment_xml as the replacement of the element at path; [] when it fits."""
+        try:
+            fragment = etree.fromstring(fragment_xml.strip().encode("utf-8"))
+        except etree.XMLSyntaxError as e:
+            return [f"The fragment is not well-formed XML: {e}"]
+
+        parent_path, original = POSITION_PATTERN.sub("", path).rsplit("/", 1)
+        tag = fragment.tag if _local_name(fragment.tag) != original else original
+        xsd_element = self.declaration(f"{parent_path}/{tag}")
+        if xsd_element is None:
+            if tag == original or self.declaration(f"{parent_path}/{original}") is None:
+                return []  # Not resolvable in this schema: left to the document validation
+            return [f"<{_local_name(fragment.tag)}> is not allowed in place of <{original}> at {parent_path or '/'}"]
+
+        errors = islice(xsd_element.iter_errors(fragment, namespaces=self.namespaces), FRAGMENT_VALIDATION_MAX_ERRORS)
+        return [record_from_error(error).to_text() for error in errors]
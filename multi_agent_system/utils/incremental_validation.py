@@ -0,0 +1,187 @@
+"""
+Incremental revalidation of documents after corrections and modifications.
+
+Each XmlDocument keeps the error records of its last validation. Agents that
+replace fragments report the changed subtrees with mark_changed(); the next
+validation then only revalidates those subtrees against their XSD element
+declarations and reuses the cached records of everything else.
+
+A full pass is done whenever the shortcut could be wrong: the document was
+changed without reporting which subtrees, a changed subtree has no
+resolvable declaration, an ancestor of a changed subtree declares a
+key/unique/keyref constraint, the ID/IDREF values of the document changed
+(identity constraints are document-wide and cannot be checked on a subtree),
+or a replacement with another tag carries ID/IDREF attributes (the new
+element may type them differently, which the values alone do not show).
+"""
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+from config import SCHEMA_CACHE_SIZE
+from utils.schema_cache import get_schema
+from utils.validation_errors import record_from_error
+from utils.xml_utils import POSITION_PATTERN, extract_schema_locations, get_schema_path, validate_xml_records
+
+
+@dataclass(frozen=True)
+class ChangedSubtree:
+    path: str                   # Positional XPath of the new element in the modified document
+    tag_changed: bool = False   # The replacement has a different tag than the original element
+
+
+@dataclass
+class ValidationState:
+    digest: str                 # Document digest the records describe
+    schema_path: str
+    namespaces: dict
+    records: list
+    identity_values: Counter
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def identity_attributes(schema) -> frozenset:
+    """Local names of the attributes typed ID, IDREF or IDREFS anywhere in the schema."""
+    from xmlschema.names import XSD_ID, XSD_IDREF, XSD_IDREFS
+    from xmlschema.validators import XsdAttribute
+
+    names = set()
+    for component in schema.maps.iter_components():
+        if not isinstance(component, XsdAttribute):
+            continue
+        xsd_type = component.type
+        while xsd_type is not None:
+            if xsd_type.name in (XSD_ID, XSD_IDREF, XSD_IDREFS):
+                names.add(component.local_name)
+                break
+            xsd_type = getattr(xsd_type, "base_type", None)
+    return frozenset(names)
+
+
+def identity_values(tree, attribute_names: frozenset) -> Counter:
+    """Multiset of the ID/IDREF attribute values of the document."""
+    values = Counter()
+    for elem in tree.iter():
+        if not isinstance(elem.tag, str):
+            continue
+        for name, value in elem.attrib.items():
+            local_name = name.rsplit("}", 1)[-1]
+            if local_name in attribute_names:
+                values[(local_name, value)] += 1
+    return values
+
+
+def _has_identity_attributes(elem, attribute_names: frozenset) -> bool:
+    """True when elem or one of its descendants has an attribute named in attribute_names."""
+    for descendant in elem.iter():
+        if not isinstance(descendant.tag, str):
+            continue
+        if any(name.rsplit("}", 1)[-1] in attribute_names for name in descendant.attrib):
+            return True
+    return False
+
+
+def _is_inside(path: str, ancestor: str) -> bool:
+    return path == ancestor or path.startswith(ancestor + "/")
+
+
+def _revalidation_targets(changes: list) -> list:
+    """Minimal set of subtree paths to revalidate.
+
+    A replacement with a different tag changes the parent's content model and
+    the positions of its siblings, so the parent is revalidated instead.
+    """
+    paths = []
+    for change in changes:
+        path = change.path
+        if change.tag_changed and path.count("/") > 1:
+            path = path.rsplit("/", 1)[0]
+        paths.append(path)
+
+    targets = []
+    for path in sorted(set(paths), key=len):
+        if not any(_is_inside(path, target) for target in targets):
+            targets.append(path)
+    return targets
+
+
+def _has_enclosing_identities(schema, target: str, namespaces: dict) -> bool:
+    """True when an ancestor of target declares a key/unique/keyref constraint.
+
+    Constraints declared inside the subtree are checked by its revalidation;
+    those of its ancestors (and the meta-schema ones, which apply to schema
+    documents only) are not.
+    """
+    steps = POSITION_PATTERN.sub("", target).split("/")[1:-1]
+    for i in range(len(steps)):
+        xsd_element = schema.find("/" + "/".join(steps[:i + 1]), namespaces=namespaces)
+        if xsd_element is not None and xsd_element.identities:
+            return True
+    return False
+
+
+def _incremental_records(state: ValidationState, tree, changes: list, current_identities: Counter) -> list:
+    """Revalidate the changed subtrees only; return None when a full pass is required."""
+    schema = get_schema(state.schema_path)
+
+    if current_identities != state.identity_values:
+        return None
+    for change in changes:
+        if not change.tag_changed:
+            continue
+        elements = tree.xpath(change.path)
+        if not elements or _has_identity_attributes(elements[0], identity_attributes(schema)):
+            return None
+
+    targets = _revalidation_targets(changes)
+    revalidated = []
+    for target in targets:
+        if _has_enclosing_identities(schema, target, state.namespaces):
+            return None
+        elements = tree.xpath(target)
+        xsd_element = schema.find(POSITION_PATTERN.sub("", target), namespaces=state.namespaces)
+        if len(elements) != 1 or xsd_element is None:
+            return None
+        for error in xsd_element.iter_errors(elements[0], namespaces=state.namespaces):
+            revalidated.append(record_from_error(error))
+
+    untouched = [r for r in state.records if not any(_is_inside(r.path, t) for t in targets)]
+    return untouched + revalidated
+
+
+def validate_document(document) -> list:
+    """Validate an XmlDocument, revalidating only what changed since its last validation."""
+    tree = document.tree
+    state = document.validation_state
+    changes = document.changes
+
+    schema_locations = extract_schema_locations(tree)
+    # Only single-schema documents are tracked; this is the S1000D case.
+    schema_path = get_schema_path(schema_locations[0], document.path) if len(schema_locations) == 1 else None
+    current_identities = None
+    if schema_path is not None:
+        current_identities = identity_values(tree, identity_attributes(get_schema(schema_path)))
+
+    records = None
+    if state is not None and state.schema_path == schema_path and changes is not None:
+        if not changes and state.digest == document.digest:
+            records = state.records
+        elif changes:
+            records = _incremental_records(state, tree, changes, current_identities)
+            if records is not None:
+                print(f"Revalidation incrémentale de {len(_revalidation_targets(changes))} sous-arbre(s).")
+
+    if records is None:
+        records = validate_xml_records(document.path, tree)
+
+    document.changes = []
+    document.validation_state = None
+    if schema_path is not None:
+        document.validation_state = ValidationState(
+            digest=document.digest,
+            schema_path=schema_path,
+            namespaces={k: v for k, v in tree.getroot().nsmap.items() if k is not None},
+            records=records,
+            identity_values=current_identities,
+        )
+    return records
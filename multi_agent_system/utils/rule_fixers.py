@@ -0,0 +1,368 @@
+"""
+Deterministic fixes of mechanical schema errors, applied before the LLM agents.
+
+The fixers are dispatched on the kind of each ValidationErrorRecord and use
+the compiled XSD declaration of the offending element:
+
+- missing_attribute: the attribute gets its fixed or default value, the only
+  value of its enumeration, or a site default (RULE_FIXER_ATTRIBUTE_DEFAULTS);
+- invalid_enumeration: a value that matches exactly one allowed value up to
+  case and whitespace is replaced by it;
+- missing_child / unexpected_child: the children are reordered to follow the
+  content model, and the required children that are still missing are
+  inserted with their minimal content.
+
+A fix is kept only when it removes the error without adding another one to
+the element, otherwise the element is restored. The document is then revalidated and only the
+remaining errors are explained and corrected by the LLM.
+"""
+from collections import Counter
+
+from lxml import etree
+
+from config import RULE_FIXER_ATTRIBUTE_DEFAULTS
+from utils.incremental_validation import ChangedSubtree, POSITION_PATTERN, validate_document
+from utils.schema_cache import get_schema
+from utils.validation_errors import _local_name, record_from_error
+from utils.xml_utils import extract_schema_locations, get_schema_path
+
+MAX_INSERTIONS = 10     # Missing children inserted in one element
+MAX_MINIMAL_DEPTH = 5   # Nesting of the minimal content of an inserted child
+
+ATTRIBUTE_DEFAULTS = dict(
+    pair.split("=", 1) for pair in RULE_FIXER_ATTRIBUTE_DEFAULTS.split(";") if "=" in pair
+)
+
+
+def _simple_type(xsd_type):
+    return xsd_type if xsd_type.is_simple() else xsd_type.content
+
+
+def _enumeration(component) -> list:
+    return [str(value) for value in (_simple_type(component.type).enumeration or [])]
+
+
+def _schema_value(component):
+    """Value given by the schema itself: fixed, default or single enumeration value."""
+    if component.fixed is not None:
+        return str(component.fixed)
+    if component.default is not None:
+        return str(component.default)
+    values = _enumeration(component)
+    return values[0] if len(values) == 1 else None
+
+
+def _attribute_value(name: str, attribute):
+    value = _schema_value(attribute)
+    if value is None:
+        value = ATTRIBUTE_DEFAULTS.get(_local_name(name))
+    return value
+
+
+def _find_attribute(xsd_element, name: str):
+    attribute = xsd_element.attributes.get(name)
+    if attribute is None:
+        attribute = next(
+            (a for n, a in xsd_element.attributes.items() if n and _local_name(n) == _local_name(name)), None
+        )
+    return attribute
+
+
+def fix_missing_attribute(xsd_element, elem, record, namespaces) -> bool:
+    name = record.attribute
+    if elem.get(name) is not None:
+        return True
+    attribute = _find_attribute(xsd_element, name)
+    value = _attribute_value(name, attribute) if attribute is not None else None
+    if value is None:
+        return False
+    elem.set(name, value)
+    return True
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.split()).lower()
+
+
+def fix_enumeration(xsd_element, elem, record, namespaces) -> bool:
+    if record.attribute:
+        component = _find_attribute(xsd_element, record.attribute)
+        value = elem.get(record.attribute)
+    else:
+        component, value = xsd_element, elem.text
+    if component is None or value is None:
+        return False
+    allowed = _enumeration(component)
+    if value in allowed:
+        return True
+    matches = [v for v in allowed if _normalize(v) == _normalize(value)]
+    if len(matches) != 1:
+        return False
+    if record.attribute:
+        elem.set(record.attribute, matches[0])
+    else:
+        elem.text = matches[0]
+    return True
+
+
+def _element_particles(group) -> list:
+    """Element particles of group and of its nested groups; None with a wildcard."""
+    from xmlschema.validators import XsdElement, XsdGroup
+
+    particles = []
+    for particle in group:
+        if isinstance(particle, XsdGroup):
+            nested = _element_particles(particle)
+            if nested is None:
+                return None
+            particles.extend(nested)
+        elif isinstance(particle, XsdElement):
+            particles.append(particle)
+        else:
+            return None
+    return particles
+
+
+def _slots(group, required: bool = True) -> list:
+    """Ordered slots of a content model made of sequences, choices and repeated groups.
+
+    Each slot is (element particles, required). A choice or a repeated group
+    is a single slot: its children keep their relative order, only the slots
+    are sorted. None when the order of the children is not fixed by the
+    model (all, xs:any).
+    """
+    from xmlschema.validators import XsdElement, XsdGroup
+
+    if group.model == "choice" or group.max_occurs != 1:
+        particles = _element_particles(group)
+        if group.model not in ("choice", "sequence") or not particles:
+            return None
+        alternatives = all if group.model == "choice" else any
+        return [(tuple(particles), required and group.min_occurs > 0 and alternatives(p.min_occurs > 0 for p in particles))]
+    if group.model != "sequence":
+        return None
+
+    slots = []
+    for particle in group:
+        if isinstance(particle, XsdGroup):
+            nested = _slots(particle, required and particle.min_occurs > 0)
+            if nested is None:
+                return None
+            slots.extend(nested)
+        elif isinstance(particle, XsdElement):
+            slots.append(((particle,), required and particle.min_occurs > 0))
+        else:
+            return None
+    return slots
+
+
+def _content_slots(xsd_element):
+    xsd_type = xsd_element.type
+    if not xsd_type.has_complex_content() or xsd_type.mixed:
+        return None
+    return _slots(xsd_type.content)
+
+
+def _slot_index(slots: list, tag: str):
+    for i, (particles, _) in enumerate(slots):
+        if any(p.is_matching(tag) for p in particles):
+            return i
+    return None
+
+
+def _reorder_children(elem, slots: list) -> bool:
+    """Stable sort of the element children by slot; comments and text keep their places."""
+    nodes = list(elem)
+    positions = [i for i, node in enumerate(nodes) if isinstance(node.tag, str)]
+    children = [nodes[i] for i in positions]
+    indices = [_slot_index(slots, child.tag) for child in children]
+    if None in indices:
+        return False
+    ordered = [children[i] for _, i in sorted(zip(indices, range(len(children))))]
+    if ordered == children:
+        return False
+    new_nodes = list(nodes)
+    for position, child in zip(positions, ordered):
+        new_nodes[position] = child
+    _set_children(elem, new_nodes, [node.tail for node in nodes])
+    return True
+
+
+def _set_children(elem, nodes: list, tails: list) -> None:
+    for node in list(elem):
+        elem.remove(node)
+    for node, tail in zip(nodes, tails):
+        node.tail = tail
+        elem.append(node)
+
+
+def _minimal_element(xsd_element, depth: int = 0):
+    """Smallest valid instance of xsd_element, or None when it needs a value the schema does not give."""
+    if depth > MAX_MINIMAL_DEPTH or xsd_element.abstract:
+        return None
+    elem = etree.Element(xsd_element.name)
+    for name, attribute in xsd_element.attributes.items():
+        if name and attribute.use == "required":
+            value = _attribute_value(name, attribute)
+            if value is None:
+                return None
+            elem.set(name, value)
+
+    xsd_type = xsd_element.type
+    if xsd_type.is_empty():
+        return elem
+    if not xsd_type.has_complex_content():
+        value = _schema_value(xsd_element)
+        if value is None and _simple_type(xsd_type).is_valid(""):
+            value = ""
+        if value is None:
+            return None
+        elem.text = value or None
+        return elem
+
+    slots = _content_slots(xsd_element)
+    if slots is None:
+        return None
+    for particles, required in slots:
+        if not required:
+            continue
+        if len(particles) != 1:
+            return None  # Required choice: which alternative is meant is not mechanical
+        for _ in range(particles[0].min_occurs):
+            child = _minimal_element(particles[0], depth + 1)
+            if child is None:
+                return None
+            elem.append(child)
+    return elem
+
+
+def _content_error(xsd_element, elem, namespaces):
+    from xmlschema.validators.exceptions import XMLSchemaChildrenValidationError
+
+    for error in xsd_element.iter_errors(elem, namespaces=namespaces):
+        if isinstance(error, XMLSchemaChildrenValidationError) and error.elem is elem:
+            return error
+    return None
+
+
+def fix_content_model(xsd_element, elem, record, namespaces) -> bool:
+    from xmlschema.validators import XsdElement
+
+    error = _content_error(xsd_element, elem, namespaces)
+    if error is None:
+        return True
+    nodes = list(elem)
+    tails = [node.tail for node in nodes]
+
+    slots = _content_slots(xsd_element)
+    if slots is not None and _reorder_children(elem, slots):
+        error = _content_error(xsd_element, elem, namespaces)
+
+    for _ in range(MAX_INSERTIONS):
+        if error is None:
+            return True
+        expected = [p for p in (getattr(error, "expected", None) or []) if isinstance(p, XsdElement)]
+        if error.invalid_tag is not None and slots is not None and _slot_index(slots, error.invalid_tag) is None:
+            break  # Unknown child: not an order or cardinality problem
+        if len(expected) != 1:
+            break
+        child = _minimal_element(expected[0])
+        if child is None:
+            break
+        if error.invalid_child is not None:
+            error.invalid_child.addprevious(child)
+        else:
+            elem.append(child)
+        error = _content_error(xsd_element, elem, namespaces)
+
+    # Not fixed: back to the original children
+    _set_children(elem, nodes, tails)
+    return False
+
+
+def _own_errors(xsd_element, elem, namespaces) -> Counter:
+    """(kind, attribute) of the errors of elem itself; its children are not validated again."""
+    errors = Counter()
+    for error in xsd_element.iter_errors(elem, namespaces=namespaces, max_depth=1):
+        if error.elem is elem:
+            record = record_from_error(error)
+            errors[(record.kind, record.attribute)] += 1
+    return errors
+
+
+def _snapshot(elem) -> tuple:
+    nodes = list(elem)
+    return dict(elem.attrib), elem.text, nodes, [node.tail for node in nodes]
+
+
+def _restore(elem, snapshot: tuple) -> None:
+    attrib, text, nodes, tails = snapshot
+    elem.attrib.clear()
+    elem.attrib.update(attrib)
+    elem.text = text
+    _set_children(elem, nodes, tails)
+
+
+FIXERS = {
+    "missing_attribute": fix_missing_attribute,
+    "invalid_enumeration": fix_enumeration,
+    "missing_child": fix_content_model,
+    "unexpected_child": fix_content_model,
+}
+
+
+def fix_records(tree, schema, namespaces: dict, records: list) -> (list, list):
+    """Apply the fixers to records; return (fixed elements, records left to the LLM)."""
+    # Resolve every element before the tree is modified
+    targets = []
+    declarations = {}
+    for record in records:
+        fixer = FIXERS.get(record.kind)
+        elements = tree.xpath(record.path) if fixer else []
+        if len(elements) != 1:
+            targets.append((record, None, None, None))
+            continue
+        schema_path = POSITION_PATTERN.sub("", record.path)
+        if schema_path not in declarations:
+            declarations[schema_path] = schema.find(schema_path, namespaces=namespaces)
+        targets.append((record, fixer, declarations[schema_path], elements[0]))
+
+    fixed, leftover = [], []
+    for record, fixer, xsd_element, elem in targets:
+        if xsd_element is None:
+            leftover.append(record)
+            continue
+        snapshot = _snapshot(elem)
+        try:
+            # The fix must remove the error of record without adding another one to elem
+            expected = _own_errors(xsd_element, elem, namespaces)
+            key = (record.kind, record.attribute)
+            expected[key] = max(0, expected[key] - 1)  # Already gone when a previous fix of elem removed it
+            ok = fixer(xsd_element, elem, record, namespaces) and not (_own_errors(xsd_element, elem, namespaces) - expected)
+        except Exception as e:
+            print(f"Règle inapplicable pour {record.path} [{record.kind}]: {e}")
+            ok = False
+        if ok:
+            if not any(e is elem for e in fixed):
+                fixed.append(elem)
+        else:
+            _restore(elem, snapshot)
+            leftover.append(record)
+    return fixed, leftover
+
+
+def apply_rule_fixers(document, records: list) -> list:
+    """Fix the mechanical errors of an XmlDocument in place; return the errors left after revalidation."""
+    tree = document.tree
+    schema_locations = extract_schema_locations(tree)
+    if len(schema_locations) != 1:
+        return records
+    schema = get_schema(get_schema_path(schema_locations[0], document.path))
+    namespaces = {k: v for k, v in tree.getroot().nsmap.items() if k is not None}
+
+    fixed, leftover = fix_records(tree, schema, namespaces, records)
+    if not fixed:
+        return records
+    print(f"{len(records) - len(leftover)} erreur(s) corrigée(s) par règle, {len(leftover)} laissée(s) au LLM.")
+    document.mark_changed([ChangedSubtree(tree.getpath(elem)) for elem in fixed])
+    return validate_document(document)
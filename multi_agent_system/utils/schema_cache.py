@@ -0,0 +1,186 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from lxml import etree
+
+from config import SCHEMA_CACHE_SIZE
+
+
+def _compile_schema(schema_path: str):
+    import xmlschema  # Heavy import, done with the first schema compilation
+    return xmlschema.XMLSchema(schema_path)
+
+
+def is_remote_location(schema_path: str) -> bool:
+    return schema_path.startswith("http://") or schema_path.startswith("https://")
+
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+def schema_fingerprint(schema_path: str) -> str:
+    """Return the SHA-256 of a schema file, recomputed only when its mtime or size change."""
+    stat = os.stat(schema_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+
+    with _fingerprints_lock:
+        cached = _fingerprints.get(schema_path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    with open(schema_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    with _fingerprints_lock:
+        _fingerprints[schema_path] = (stamp, digest)
+    return digest
+
+
+def schema_cache_key(schema_path: str) -> tuple:
+    """Build the registry key: resolved path plus content fingerprint (URLs are keyed as-is)."""
+    if is_remote_location(schema_path):
+        return schema_path, None
+    resolved = os.path.realpath(schema_path)
+    return resolved, schema_fingerprint(resolved)
+
+
+class SchemaRegistry:
+    """Thread-safe, bounded LRU cache of compiled XSD schemas shared by the whole process."""
+
+    def __init__(self, loader=_compile_schema, maxsize=SCHEMA_CACHE_SIZE):
+        self.loader = loader
+        self.maxsize = max(1, maxsize)
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, schema_path: str):
+        """Return the compiled schema for schema_path, compiling it at most once per key."""
+        key = schema_cache_key(schema_path)
+
+        with self._lock:
+            schema = self._lookup(key)
+            if schema is not None:
+                return schema
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Compile outside the registry lock so other schemas stay available,
+        # but serialize concurrent misses on the same key.
+        with key_lock:
+            try:
+                with self._lock:
+                    schema = self._lookup(key)
+                    if schema is not None:
+                        return schema
+                    self.misses += 1
+
+                schema = self.loader(schema_path)
+
+                with self._lock:
+                    self._store(key, schema)
+                return schema
+            finally:
+                # Also when the loader raises: the next get() compiles again with a new lock
+                with self._lock:
+                    if self._key_locks.get(key) is key_lock:
+                        del self._key_locks[key]
+
+    def put(self, schema_path: str, schema) -> None:
+        """Register an already compiled schema for schema_path."""
+        key = schema_cache_key(schema_path)
+        with self._lock:
+            self._store(key, schema)
+
+    def _lookup(self, key):
+        schema = self._schemas.get(key)
+        if schema is not None:
+            self._schemas.move_to_end(key)
+            self.hits += 1
+        return schema
+
+    def _store(self, key, schema) -> None:
+        # A new fingerprint for the same file makes the old entry unreachable; drop it.
+        for stale in [k for k in self._schemas if k[0] == key[0] and k != key]:
+            del self._schemas[stale]
+        self._schemas[key] = schema
+        self._schemas.move_to_end(key)
+        while len(self._schemas) > self.maxsize:
+            self._schemas.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._schemas.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._schemas),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _load_schema(schema_path: str):
+    # Prefer the pre-built on-disk snapshot; it compiles the XSD sources when stale.
+    from utils.schema_snapshot import load_or_compile
+    return load_or_compile(schema_path)
+
+
+schema_registry = SchemaRegistry(loader=_load_schema)
+
+def get_schema(schema_path: str):
+    """Return the process-wide compiled xmlschema object for schema_path."""
+    return schema_registry.get(schema_path)
+
+def schema_cache_stats() -> dict:
+    return schema_registry.stats()
+
+
+class Libxml2Schema:
+    """libxml2 (lxml.etree.XMLSchema) validator; one validation at a time per schema."""
+
+    def __init__(self, schema_path: str):
+        self.schema = etree.XMLSchema(etree.parse(schema_path))
+        self._lock = threading.Lock()
+
+    def is_valid(self, tree) -> bool:
+        with self._lock:
+            return self.schema.validate(tree)
+
+    def file_errors(self, xml_path: str) -> list:
+        """Validate xml_path while parsing it, releasing each element; the libxml2 errors, [] when valid."""
+        with self._lock:
+            try:
+                for _, elem in etree.iterparse(xml_path, events=("end",), schema=self.schema):
+                    elem.clear(keep_tail=True)
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+            except etree.XMLSyntaxError as e:
+                return list(e.error_log) or [e]
+        return []
+
+
+def _load_libxml2_schema(schema_path: str):
+    # False (not None) is cached, so a schema libxml2 cannot compile is tried only once.
+    try:
+        return Libxml2Schema(schema_path)
+    except (etree.XMLSchemaParseError, etree.XMLSyntaxError, OSError) as e:
+        print(f"libxml2 cannot compile {schema_path}, using xmlschema only: {e}")
+        return False
+
+
+libxml2_registry = SchemaRegistry(loader=_load_libxml2_schema)
+
+def get_libxml2_schema(schema_path: str):
+    """Return the process-wide libxml2 validator for schema_path, or None if unavailable."""
+    return libxml2_registry.get(schema_path) or None
@@ -0,0 +1,92 @@
+"""
+XML-catalog-style resolution of http(s) schema locations to local copies.
+
+S1000D data modules reference their schema by URL (for example
+http://www.s1000d.org/S1000D_4-2/xml_schema_flat/proced.xsd). Known URL
+prefixes are rewritten to the local data/xml_schema_flat directory, both for
+the schemaLocation of the document and for the imports of the schemas
+themselves (xlink.xsd, rdf.xsd, ...). A URL that no catalog entry covers is
+reported as a miss; it is only downloaded when SCHEMA_ALLOW_DOWNLOAD is set.
+"""
+import os
+import threading
+from collections import Counter
+
+from config import SCHEMA_ALLOW_DOWNLOAD, SCHEMA_CATALOG_EXTRA, SCHEMA_DIR
+
+S1000D_ISSUES = ("4-0", "4-1", "4-2", "5-0")
+
+# URL prefix -> local directory
+SCHEMA_CATALOG = {
+    f"{scheme}://www.s1000d.org/S1000D_{issue}/xml_schema_flat/": SCHEMA_DIR
+    for scheme in ("http", "https")
+    for issue in S1000D_ISSUES
+}
+
+
+class SchemaCatalogMiss(ValueError):
+    """A remote schema location has no local copy in the catalog."""
+
+
+def _parse_extra_entries(value: str) -> dict:
+    """Parse "prefix=directory;prefix=directory" entries from the environment."""
+    entries = {}
+    for item in filter(None, (part.strip() for part in value.split(";"))):
+        prefix, _, directory = item.partition("=")
+        if prefix and directory:
+            entries[prefix.strip()] = directory.strip()
+    return entries
+
+
+SCHEMA_CATALOG.update(_parse_extra_entries(SCHEMA_CATALOG_EXTRA))
+
+_misses = Counter()
+_misses_lock = threading.Lock()
+
+
+def is_remote_url(location: str) -> bool:
+    return location.startswith("http://") or location.startswith("https://")
+
+
+def resolve_schema_url(url: str) -> str:
+    """Return the local file for url, or None when no catalog entry has a copy of it."""
+    for prefix in sorted(SCHEMA_CATALOG, key=len, reverse=True):
+        if url.startswith(prefix):
+            local_path = os.path.join(SCHEMA_CATALOG[prefix], url[len(prefix):])
+            if os.path.isfile(local_path):
+                return local_path
+    return None
+
+
+def map_schema_uri(uri: str) -> str:
+    """uri_mapper for xmlschema: rewrite catalogued URLs, report the others."""
+    if not is_remote_url(uri):
+        return uri
+
+    local_path = resolve_schema_url(uri)
+    if local_path is not None:
+        return local_path
+
+    with _misses_lock:
+        _misses[uri] += 1
+    if not SCHEMA_ALLOW_DOWNLOAD:
+        raise SchemaCatalogMiss(
+            f"No local copy of {uri} in the schema catalog and downloads are disabled "
+            f"(add an entry with SCHEMA_CATALOG_EXTRA or set SCHEMA_ALLOW_DOWNLOAD=1)"
+        )
+    print(f"Warning: schema catalog miss, downloading {uri}")
+    return uri
+
+
+def catalog_misses() -> dict:
+    """URLs that could not be resolved locally, with their number of requests."""
+    with _misses_lock:
+        return dict(_misses)
+
+
+def schema_loader_options() -> dict:
+    """Keyword arguments for xmlschema.XMLSchema that keep schema loading offline."""
+    return {
+        "uri_mapper": map_schema_uri,
+        "allow": "all" if SCHEMA_ALLOW_DOWNLOAD else "local",
+    }
@@ -0,0 +1,178 @@
+"""
+Pre-built snapshots of the compiled S1000D schemas.
+
+Compiling one of the flat S1000D XSDs takes seconds, so new workers load the
+pickled xmlschema objects from a versioned snapshot directory instead. A
+snapshot entry is only used while the fingerprints of the XSD and of every
+schema it imports still match; otherwise the sources are compiled again.
+
+Build (or refresh) the snapshot with:
+    python -m utils.schema_snapshot
+"""
+import argparse
+import glob
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+from config import SCHEMA_DIR, SCHEMA_SNAPSHOT_DIR
+from utils.schema_cache import is_remote_location, schema_fingerprint
+from utils.schema_catalog import schema_loader_options
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+
+# Compiled schemas are deep object graphs; the default limit is too low to pickle them.
+PICKLE_RECURSION_LIMIT = 20000
+
+
+def snapshot_version() -> str:
+    """Snapshots are only compatible with the xmlschema and Python versions that wrote them."""
+    import xmlschema
+
+    return "v{}-xmlschema{}-py{}{}".format(
+        SNAPSHOT_FORMAT, xmlschema.__version__, sys.version_info.major, sys.version_info.minor
+    )
+
+
+def snapshot_path(snapshot_dir: str = SCHEMA_SNAPSHOT_DIR) -> str:
+    return os.path.join(snapshot_dir, snapshot_version())
+
+
+def _schema_dependencies(schema, schema_dir: str) -> list:
+    """Files of schema_dir the compiled schema was built from (the XSD itself and its imports).
+
+    Components outside schema_dir (the XSD meta-schema bundled with xmlschema)
+    are covered by the xmlschema version in the snapshot name.
+    """
+    schema_dir = os.path.realpath(schema_dir)
+    files = set()
+    for component in schema.maps.iter_schemas():
+        parts = urlsplit(component.url or "")
+        if parts.scheme not in ("", "file"):
+            continue
+        path = os.path.realpath(unquote(parts.path))
+        if os.path.dirname(path) == schema_dir and os.path.isfile(path):
+            files.add(path)
+    return sorted(files)
+
+
+def _with_recursion_limit(func, *args):
+    previous = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(previous, PICKLE_RECURSION_LIMIT))
+    try:
+        return func(*args)
+    finally:
+        sys.setrecursionlimit(previous)
+
+
+def build_snapshot(schema_dir: str = SCHEMA_DIR, snapshot_dir: str = SCHEMA_SNAPSHOT_DIR) -> dict:
+    """Compile every XSD in schema_dir and write the pickled schemas plus a manifest."""
+    import xmlschema
+
+    target = snapshot_path(snapshot_dir)
+    os.makedirs(target, exist_ok=True)
+
+    manifest = {"version": snapshot_version(), "schemas": {}}
+    xsd_files = sorted(glob.glob(os.path.join(schema_dir, "*.xsd")))
+    print(f"Precompiling {len(xsd_files)} schemas from {schema_dir}")
+
+    for xsd_file in xsd_files:
+        name = os.path.basename(xsd_file)
+        start = time.perf_counter()
+        try:
+            schema = xmlschema.XMLSchema(xsd_file, **schema_loader_options())
+            payload = _with_recursion_limit(pickle.dumps, schema, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"  ✗ {name}: {e}")
+            continue
+
+        pickle_name = os.path.splitext(name)[0] + ".pickle"
+        tmp_path = os.path.join(target, pickle_name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, os.path.join(target, pickle_name))
+
+        manifest["schemas"][name] = {
+            "file": pickle_name,
+            "dependencies": {
+                os.path.basename(dep): schema_fingerprint(dep) for dep in _schema_dependencies(schema, schema_dir)
+            },
+        }
+        print(f"  ✓ {name} ({time.perf_counter() - start:.2f}s, {len(payload) / 1024:.0f} KB)")
+
+    tmp_manifest = os.path.join(target, MANIFEST_NAME + ".tmp")
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_manifest, os.path.join(target, MANIFEST_NAME))
+
+    _manifests.pop(target, None)
+    print(f"Snapshot written to {target}")
+    return manifest
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def load_manifest(snapshot_dir: str = SCHEMA_SNAPSHOT_DIR) -> dict:
+    """Read (once per process) the manifest of the snapshot matching the running versions."""
+    target = snapshot_path(snapshot_dir)
+    with _manifests_lock:
+        if target not in _manifests:
+            try:
+                with open(os.path.join(target, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                    _manifests[target] = json.load(f)
+            except (OSError, ValueError):
+                _manifests[target] = {"schemas": {}}
+        return _manifests[target]
+
+
+def _is_fresh(entry: dict, schema_path: str) -> bool:
+    schema_dir = os.path.dirname(os.path.realpath(schema_path))
+    for dep_name, fingerprint in entry.get("dependencies", {}).items():
+        dep_path = os.path.join(schema_dir, dep_name)
+        if not os.path.isfile(dep_path) or schema_fingerprint(os.path.realpath(dep_path)) != fingerprint:
+            return False
+    return os.path.basename(schema_path) in entry.get("dependencies", {})
+
+
+def load_snapshot_schema(schema_path: str, snapshot_dir: str = SCHEMA_SNAPSHOT_DIR):
+    """Return the pickled schema for schema_path, or None when absent, stale or unreadable."""
+    if is_remote_location(schema_path):
+        return None
+
+    entry = load_manifest(snapshot_dir)["schemas"].get(os.path.basename(schema_path))
+    if not entry or not _is_fresh(entry, schema_path):
+        return None
+
+    try:
+        with open(os.path.join(snapshot_path(snapshot_dir), entry["file"]), "rb") as f:
+            return _with_recursion_limit(pickle.load, f)
+    except Exception as e:
+        print(f"Ignoring unreadable schema snapshot for {schema_path}: {e}")
+        return None
+
+
+def load_or_compile(schema_path: str):
+    """Load schema_path from the snapshot, compiling the XSD sources when it is stale."""
+    schema = load_snapshot_schema(schema_path)
+    if schema is None:
+        import xmlschema
+
+        schema = xmlschema.XMLSchema(schema_path, **schema_loader_options())
+    return schema
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompile the S1000D schemas into an on-disk snapshot")
+    parser.add_argument("--schema-dir", default=SCHEMA_DIR, help="Directory containing the XSD files")
+    parser.add_argument("--snapshot-dir", default=SCHEMA_SNAPSHOT_DIR, help="Root directory of the snapshots")
+    args = parser.parse_args()
+
+    manifest = build_snapshot(args.schema_dir, args.snapshot_dir)
+    if not manifest["schemas"]:
+        sys.exit(1)
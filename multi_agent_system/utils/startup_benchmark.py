@@ -0,0 +1,110 @@
+"""
+Startup benchmark: import time of the modules of the pipeline.
+
+Each module is imported in a fresh interpreter with ``python -X importtime``,
+so a measure includes the whole import chain of the module and nothing is
+shared through sys.modules. The report gives, per module, the median
+cumulative import time, its heaviest dependencies and the heavy packages
+(Snowflake connector, xmlschema, Streamlit) its import pulls in; these
+should only be imported on first use.
+
+Usage:
+    python -m utils.startup_benchmark
+    python -m utils.startup_benchmark agent_modifier orchestrator --repeat 5 --json
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+
+from config import BASE_DIR
+
+MODULES = [
+    "config",
+    "connectors.cortex_llm",
+    "connectors.audit_writer",
+    "utils.xml_document",
+    "utils.xml_utils",
+    "utils.incremental_validation",
+    "utils.rule_fixers",
+    "utils.schema_snapshot",
+    "agent_validator",
+    "agent_corrector",
+    "agent_modifier",
+    "orchestrator",
+]
+HEAVY_PACKAGES = ("snowflake.connector", "xmlschema", "streamlit")
+IMPORTTIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)")
+
+
+def measure_import(module: str, python: str = sys.executable) -> dict:
+    """Import module in a fresh interpreter; cumulative import time (ms) of every module it loads."""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit code {result.returncode}")
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            times[match.group(3)] = int(match.group(2)) / 1000
+    return times
+
+
+def _heaviest_packages(times: dict, module: str, top: int, baseline: set) -> list:
+    """Top-level packages imported by module, by cumulative time; interpreter startup imports excluded."""
+    packages = {}
+    own = module.split(".")[0]
+    for name, ms in times.items():
+        package = name.split(".")[0]
+        if package != own and name not in baseline:
+            packages[package] = max(packages.get(package, 0.0), ms)
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def run_benchmark(modules: list, repeat: int = 3, top: int = 5) -> list:
+    baseline = set(measure_import("sys"))  # Modules the interpreter loads before any import
+    report = []
+    for module in modules:
+        try:
+            runs = [measure_import(module) for _ in range(max(1, repeat))]
+        except RuntimeError as e:
+            report.append({"module": module, "error": str(e)})
+            continue
+        report.append({
+            "module": module,
+            "import_ms": round(statistics.median(run.get(module, 0.0) for run in runs), 1),
+            "heavy_imports": [package for package in HEAVY_PACKAGES if package in runs[-1]],
+            "heaviest": [(package, round(ms, 1)) for package, ms in _heaviest_packages(runs[-1], module, top, baseline)],
+        })
+    return report
+
+
+def format_report(report: list) -> str:
+    lines = [f"{'module':<32} {'import ms':>10}  heavy imports / heaviest dependencies"]
+    for entry in report:
+        if "error" in entry:
+            lines.append(f"{entry['module']:<32} {'failed':>10}  {entry['error']}")
+            continue
+        heavy = ", ".join(entry["heavy_imports"]) or "-"
+        heaviest = ", ".join(f"{package} {ms:.0f}" for package, ms in entry["heaviest"])
+        lines.append(f"{entry['module']:<32} {entry['import_ms']:>10.1f}  {heavy} / {heaviest}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the import time of the pipeline modules")
+    parser.add_argument("modules", nargs="*", default=MODULES, help="Modules to import (default: the agents and their connectors)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh imports per module, the median is reported")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest dependencies listed per module")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.modules, args.repeat, args.top)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    sys.exit(1 if any("error" in entry for entry in report) else 0)
@@ -0,0 +1,218 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+MISSING_ATTRIBUTE_PATTERN = re.compile(r"missing required attribute '([^']+)'")
+UNEXPECTED_ATTRIBUTE_PATTERN = re.compile(r"'([^']+)' attribute not allowed")
+ATTRIBUTE_VALUE_PATTERN = re.compile(r"^attribute ([^=\s]+)=")
+QUOTED_VALUE_PATTERN = re.compile(r"'[^']*'|\"[^\"]*\"")
+NUMBER_PATTERN = re.compile(r"\d+")
+ENUMERATION_PATTERN = re.compile(r"must be one of .*")
+
+# Kinds whose reason only names schema components (tags, positions), no instance values
+STRUCTURAL_KINDS = ("missing_child", "unexpected_child", "missing_attribute", "unexpected_attribute")
+
+
+@dataclass(frozen=True, slots=True)
+class ValidationErrorRecord:
+    """One schema violation, taken directly from the xmlschema error object."""
+    kind: str                       # e.g. "missing_attribute", "unexpected_child", "invalid_value"
+    path: str                       # XPath of the offending element, with sibling indices
+    element: str                    # Tag of the offending element
+    line: Optional[int]             # Source line of the element, when known
+    reason: str                     # Short reason reported by the schema validator
+    expected: tuple = ()            # Names of the particles the content model expected
+    attribute: Optional[str] = None # Attribute concerned by the error, if any
+
+    def to_text(self) -> str:
+        text = f"{self.path} [{self.kind}]"
+        if self.line:
+            text += f" line {self.line}"
+        text += f": {self.reason}"
+        if self.expected:
+            text += f" (expected: {', '.join(self.expected)})"
+        return text
+
+
+def _element_path(error) -> str:
+    elem = error.elem
+    if elem is not None and hasattr(elem, "getroottree"):
+        # lxml element: positional path such as /dmodule/content/.../proceduralStep[2]
+        return elem.getroottree().getpath(elem)
+    return error.path or "N/A"
+
+
+def _particle_name(particle) -> str:
+    return getattr(particle, "prefixed_name", None) or getattr(particle, "name", None) or str(particle)
+
+
+def _error_attribute(error, reason: str) -> Optional[str]:
+    """Attribute whose value is invalid, None for an element error.
+
+    The validator of a value error is the failing facet or simple type, so the
+    XsdAttribute is looked up in its parent chain, then in the reason
+    ("attribute issueType='New': ...") for global types that have no parent.
+    """
+    from xmlschema.validators import XsdAttribute
+
+    component = error.validator
+    while component is not None:
+        if isinstance(component, XsdAttribute):
+            return component.name
+        component = getattr(component, "parent", None)
+    match = ATTRIBUTE_VALUE_PATTERN.match(reason)
+    return match.group(1) if match else None
+
+
+def _error_kind(error, reason: str) -> (str, Optional[str]):
+    """Classify the error and return the attribute it concerns, if any."""
+    # xmlschema is imported with the first error, not with this module
+    from xmlschema.validators.exceptions import XMLSchemaChildrenValidationError, XMLSchemaDecodeError
+
+    if isinstance(error, XMLSchemaChildrenValidationError):
+        return ("missing_child" if error.invalid_tag is None else "unexpected_child"), None
+
+    match = MISSING_ATTRIBUTE_PATTERN.search(reason)
+    if match:
+        return "missing_attribute", match.group(1)
+    match = UNEXPECTED_ATTRIBUTE_PATTERN.search(reason)
+    if match:
+        return "unexpected_attribute", match.group(1)
+
+    attribute = _error_attribute(error, reason)
+    if "must be one of" in reason:
+        return "invalid_enumeration", attribute
+    if isinstance(error, XMLSchemaDecodeError) or attribute:
+        return "invalid_value", attribute
+    return "invalid", attribute
+
+
+def record_from_error(error) -> ValidationErrorRecord:
+    """Build a ValidationErrorRecord from an XMLSchemaValidationError without formatting it."""
+    from xmlschema.validators.exceptions import XMLSchemaChildrenValidationError
+
+    reason = error.reason or ""
+    kind, attribute = _error_kind(error, reason)
+
+    elem = error.elem
+    tag = elem.tag if elem is not None and isinstance(getattr(elem, "tag", None), str) else ""
+
+    expected = ()
+    if isinstance(error, XMLSchemaChildrenValidationError) and getattr(error, "expected", None):
+        expected = tuple(_particle_name(p) for p in error.expected)
+
+    return ValidationErrorRecord(
+        kind=kind,
+        path=_element_path(error),
+        element=tag,
+        line=getattr(elem, "sourceline", None),
+        reason=reason,
+        expected=expected,
+        attribute=attribute,
+    )
+
+
+def group_records(records: list) -> dict:
+    """Group records by (path, kind), preserving document order."""
+    groups = {}
+    for record in records:
+        groups.setdefault((record.path, record.kind), []).append(record)
+    return groups
+
+
+def dedupe_records(records: list) -> list:
+    """Keep one record per (path, kind, reason)."""
+    seen = set()
+    unique = []
+    for record in records:
+        key = (record.path, record.kind, record.reason)
+        if key not in seen:
+            seen.add(key)
+            unique.append(record)
+    return unique
+
+
+def format_records(records: list) -> str:
+    """Compact, one-line-per-error text for the LLM agents."""
+    lines = []
+    for (path, kind), group in group_records(dedupe_records(records)).items():
+        first = group[0]
+        if len(group) == 1:
+            lines.append(first.to_text())
+        else:
+            line = f" line {first.line}" if first.line else ""
+            reasons = "; ".join(r.reason for r in group)
+            lines.append(f"{path} [{kind}]{line}: {reasons}")
+    return "\n".join(lines)
+
+
+def record_paths(records: list) -> list:
+    """Distinct error paths in document order."""
+    return list(dict.fromkeys(record.path for record in records))
+
+
+@dataclass(frozen=True, slots=True)
+class ErrorSignature:
+    """Class of a schema violation, independent of the document it was found in.
+
+    Element, attribute and expected particle names are kept; instance values,
+    positions and paths are dropped, so the same violation in two files (or
+    at two places of one file) has the same signature.
+    """
+    kind: str
+    element: str
+    attribute: Optional[str]
+    expected: tuple
+    reason: str
+
+    def to_text(self) -> str:
+        text = f"<{self.element}> [{self.kind}]"
+        if self.attribute:
+            text += f" @{self.attribute}"
+        text += f": {self.reason}"
+        if self.expected:
+            text += f" (expected: {', '.join(self.expected)})"
+        return text
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _signature_reason(record: ValidationErrorRecord) -> str:
+    reason = record.reason
+    if record.kind == "invalid_enumeration":
+        # The allowed values come from the schema; the rejected value does not
+        match = ENUMERATION_PATTERN.search(reason)
+        return match.group(0) if match else "value not in enumeration"
+    if record.kind in STRUCTURAL_KINDS:
+        # Quoted names are tags here; only the positions depend on the instance
+        return NUMBER_PATTERN.sub("N", reason)
+    return NUMBER_PATTERN.sub("N", QUOTED_VALUE_PATTERN.sub("'...'", reason))
+
+
+def error_signature(record: ValidationErrorRecord) -> ErrorSignature:
+    return ErrorSignature(
+        kind=record.kind,
+        element=_local_name(record.element),
+        attribute=record.attribute,
+        expected=tuple(_local_name(name) for name in record.expected),
+        reason=_signature_reason(record),
+    )
+
+
+def cluster_records(records: list) -> dict:
+    """Group records by error signature, in order of first occurrence."""
+    clusters = {}
+    for record in dedupe_records(records):
+        clusters.setdefault(error_signature(record), []).append(record)
+    return clusters
+
+
+def format_clusters(clusters: dict, explanations: dict) -> str:
+    """One block per error class: the signature, its paths and its explanation."""
+    blocks = []
+    for signature, group in clusters.items():
+        paths = ", ".join(record_paths(group))
+        blocks.append(f"{signature.to_text()}\nPaths: {paths}\n{explanations.get(signature, '')}")
+    return "\n\n".join(blocks)
@@ -0,0 +1,96 @@
+import hashlib
+import os
+
+from lxml import etree
+
+
+class XmlDocument:
+    """Parsed XML document shared by the validator, corrector, modifier and orchestrator.
+
+    The lxml tree is parsed once, modified in place by the agents and written
+    to disk only when save() is called. Agents report their modifications
+    with mark_changed() so the validator knows what to revalidate.
+    """
+
+    def __init__(self, path: str, tree: etree._ElementTree = None):
+        self.path = path
+        self._tree = tree
+        self.dirty = False
+        self.changes = []              # Subtrees changed since the last validation; None = unknown
+        self.validation_state = None   # Set by utils.incremental_validation
+        self._digest = None
+
+    @classmethod
+    def load(cls, path: str) -> "XmlDocument":
+        """Document backed by path; the file is parsed on first access to tree."""
+        return cls(path)
+
+    @classmethod
+    def from_string(cls, xml_str: str, path: str) -> "XmlDocument":
+        document = cls(path)
+        document.replace_content(xml_str)
+        return document
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._tree is not None
+
+    @property
+    def tree(self) -> etree._ElementTree:
+        if self._tree is None:
+            parser = etree.XMLParser(recover=True)
+            self._tree = etree.parse(self.path, parser)
+        return self._tree
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 of the current content, recomputed only after a change."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(etree.tostring(self.tree)).hexdigest()
+        return self._digest
+
+    def mark_changed(self, changes: list = None) -> None:
+        """Record a modification; changes lists the replaced subtrees when they are known."""
+        self.dirty = True
+        self._digest = None
+        if changes is None or self.changes is None:
+            self.changes = None
+        else:
+            self.changes.extend(changes)
+
+    def replace_content(self, xml_str: str) -> None:
+        """Replace the whole document with xml_str (e.g. the output of the modifier agent)."""
+        parser = etree.XMLParser(recover=True)
+        root = etree.fromstring(xml_str.encode("utf-8"), parser)
+        self._tree = root.getroottree()  # Keeps the DOCTYPE of xml_str
+        self.mark_changed()
+
+    def to_string(self) -> str:
+        return etree.tostring(self.tree, pretty_print=True, encoding="unicode")
+
+    def to_bytes(self) -> bytes:
+        return etree.tostring(self.tree, pretty_print=True, encoding="utf-8", xml_declaration=True)
+
+    def save(self, path: str = None) -> str:
+        """Write the document to path (default: its own path) if it has unsaved changes."""
+        path = path or self.path
+        if self.dirty or path != self.path or not os.path.exists(path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(self.to_bytes())
+            self.dirty = False
+        self.path = path
+        return path
+
+
+def as_document(xml_file) -> XmlDocument:
+    """Accept either an XmlDocument or a file path."""
+    if isinstance(xml_file, XmlDocument):
+        return xml_file
+    return XmlDocument.load(xml_file)
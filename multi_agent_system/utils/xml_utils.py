@@ -1,11 +1,28 @@
 import os
-import xmlschema
+from lxml import etree
 from lxml.etree import _ElementTree
 import re
+
+from config import SCHEMA_DIR, VALIDATION_FAST_PATH, VALIDATION_STREAMING_DEPTH, VALIDATION_STREAMING_THRESHOLD_MB
+from utils.schema_cache import get_libxml2_schema, get_schema
+from utils.schema_catalog import is_remote_url, map_schema_uri
+from utils.validation_errors import ValidationErrorRecord, format_records, record_from_error, record_paths
+
+POSITION_PATTERN = re.compile(r"\[\d+\]")
+
 def extract_schema_locations(tree: _ElementTree) -> list:
     """Extract all schema locations from the XML file."""
    
-    root = tree.getroot()
+    return schema_locations_from_root(tree.getroot())
+
+def extract_schema_locations_from_file(xml_path: str) -> (list, dict):
+    """Read the schema locations and namespaces from the root tag only, without parsing the whole file."""
+    for _, root in etree.iterparse(xml_path, events=("start",)):
+        namespaces = {k: v for k, v in root.nsmap.items() if k is not None}
+        return schema_locations_from_root(root), namespaces
+    raise ValueError(f"No root element found in {xml_path}")
+
+def schema_locations_from_root(root) -> list:
     xsi_ns = "http://www.w3.org/2001/XMLSchema-instance"
     
     # Look for schemaLocation or noNamespaceSchemaLocation attributes
@@ -18,13 +35,11 @@ def extract_schema_locations(tree: _ElementTree) -> list:
     return schema_locations.split()  # Return as a list of schema URIs
 
 def get_schema_path(schema_location: str, base_path: str) -> str:
-    """Resolve the schema location to a file path or URL."""
-    # If schema_location is an absolute URL, return it
-  
-    if schema_location.startswith("http://") or schema_location.startswith("https://"):
-        return schema_location
+    """Resolve the schema location to a local file path (or URL when downloads are allowed)."""
+    # Absolute URLs are mapped to the local copies of the schema catalog
+    if is_remote_url(schema_location):
+        return map_schema_uri(schema_location)
     
-    print(f"Schema location: {schema_location}")
     # If it's a relative file path, resolve it based on the base path of the XML file
     schema_file_path = os.path.join(os.path.dirname(base_path), schema_location)
     
@@ -32,49 +47,215 @@ def get_schema_path(schema_location: str, base_path: str) -> str:
     if os.path.isfile(schema_file_path):
         return schema_file_path
     
-    # If it's not found, you can raise an error or search in predefined directories
-    # For example, search in a folder of known schemas
-    known_schemas_dir = "data/xml_schema_flat"  # Define the base directory for schemas
-    potential_schema_path = os.path.join(known_schemas_dir, schema_location)
+    # If it's not found, search in the folder of known schemas
+    potential_schema_path = os.path.join(SCHEMA_DIR, schema_location)
     if os.path.isfile(potential_schema_path):
         return potential_schema_path
     
-    raise ValueError(f"Schema not found: {schema_location} (searched in {known_schemas_dir})")
+    raise ValueError(f"Schema not found: {schema_location} (searched in {SCHEMA_DIR})")
+
+def iter_validation_errors(schema, tree: _ElementTree, namespaces: dict = None):
+    """Yield the schema errors of an in-memory lxml tree in one traversal."""
+    return schema.iter_errors(tree, namespaces=namespaces)
+
+def use_streaming_validation(xml_path: str) -> bool:
+    """Large data modules are validated in streaming mode to keep memory bounded."""
+    return os.path.getsize(xml_path) >= VALIDATION_STREAMING_THRESHOLD_MB * 1024 * 1024
+
+def identity_type(xsd_type) -> str:
+    """"ID", "IDREF" or "IDREFS" when xsd_type is or derives from that XSD type, otherwise None."""
+    from xmlschema.names import XSD_ID, XSD_IDREF, XSD_IDREFS
+
+    types = {XSD_ID: "ID", XSD_IDREF: "IDREF", XSD_IDREFS: "IDREFS"}
+    while xsd_type is not None:
+        if xsd_type.name in types:
+            return types[xsd_type.name]
+        xsd_type = getattr(xsd_type, "base_type", None)
+    return None
+
+def _identity_attributes(xsd_element) -> dict:
+    """Attribute name -> "ID", "IDREF" or "IDREFS" for the identity attributes of a declaration."""
+    if xsd_element is None:
+        return {}
+    typed = {}
+    for name, attribute in xsd_element.attributes.items():
+        kind = identity_type(attribute.type) if name else None
+        if kind:
+            typed[name] = kind
+    return typed
+
+class _IdentityChecker:
+    """xs:ID uniqueness and IDREF targets of a streamed document, as the full validation reports them.
+
+    Neither the subtree validation nor libxml2 in streaming mode checks them:
+    they are document-wide.
+    """
+
+    def __init__(self):
+        self.ids = set()
+        self.refs = {}      # Referenced value -> first referencing attribute, in document order
+
+    def start(self, elem, typed: dict):
+        for name, kind in typed.items():
+            value = elem.get(name)
+            if value is None:
+                continue
+            if kind != "ID":
+                for ref in (value.split() if kind == "IDREFS" else [value]):
+                    self.refs.setdefault(ref, name)
+            elif value in self.ids:
+                yield ValidationErrorRecord(
+                    kind="invalid_value",
+                    path=elem.getroottree().getpath(elem),
+                    element=elem.tag,
+                    line=elem.sourceline,
+                    reason=f"attribute {name}={value!r}: duplicated xs:ID value {value!r}",
+                    attribute=name,
+                )
+            else:
+                self.ids.add(value)
+
+    def end(self, root):
+        for ref in self.refs:
+            if ref not in self.ids:
+                yield ValidationErrorRecord(
+                    kind="invalid",
+                    path=root.getroottree().getpath(root),
+                    element=root.tag,
+                    line=root.sourceline,
+                    reason=f"IDREF {ref!r} not found in XML document",
+                )
+
+def _is_identity_error(error) -> bool:
+    reason = error.reason or ""
+    return "duplicated xs:ID value" in reason or (reason.startswith("IDREF ") and "not found" in reason)
+
+def _iter_streaming_records(xml_path: str, schema, namespaces: dict, depth: int, details: bool = True):
+    """Error records of xml_path, with at most one subtree of the given depth in memory.
+
+    Each element at depth is validated against its declaration as soon as it
+    is parsed, then emptied; its tag stays in place for the content model of
+    its parent. The levels above depth are validated at the end, with
+    max_depth so the emptied elements are not validated again. ID and IDREF
+    values are checked across the whole document by _IdentityChecker; with
+    details=False (libxml2 already accepted the file) only they are.
+    """
+    root = None
+    paths = []          # Schema paths of the open elements, without positions
+    declarations = {}
+    identities = {}
+    checker = _IdentityChecker()
+    for event, elem in etree.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            root = elem if root is None else root
+            local_name = etree.QName(elem).localname
+            name = f"{elem.prefix}:{local_name}" if elem.prefix else local_name
+            schema_path = f"{paths[-1] if paths else ''}/{name}"
+            paths.append(schema_path)
+            if schema_path not in declarations:
+                declarations[schema_path] = schema.find(schema_path, namespaces=namespaces)
+                identities[schema_path] = _identity_attributes(declarations[schema_path])
+            if identities[schema_path]:
+                yield from checker.start(elem, identities[schema_path])
+            continue
+        schema_path = paths.pop()
+        if len(paths) != depth:
+            continue
+        xsd_element = declarations[schema_path]
+        if details and xsd_element is None:
+            print(f"No declaration for {schema_path}, not validated in streaming mode.")
+        elif details:
+            for error in xsd_element.iter_errors(elem, namespaces=namespaces):
+                if not _is_identity_error(error):
+                    yield record_from_error(error)
+        elem.clear(keep_tail=True)
+    if root is None:
+        return
+    if details:
+        for error in schema.iter_errors(root, namespaces=namespaces, max_depth=depth):
+            if not _is_identity_error(error):
+                yield record_from_error(error)
+    yield from checker.end(root)
+
+def _libxml2_record(entry) -> ValidationErrorRecord:
+    return ValidationErrorRecord(
+        kind="invalid",
+        path=getattr(entry, "path", None) or "N/A",
+        element="",
+        line=getattr(entry, "line", None),
+        reason=getattr(entry, "message", None) or str(entry),
+    )
+
+def iter_xml_records_streaming(xml_path: str):
+    """Validate the XML file lazily and yield error records as soon as they are found.
+
+    The document is never fully loaded. libxml2 first validates it while
+    parsing (pass/fail, in C); only a rejected file gets the detailed
+    xmlschema records, one subtree at a time (VALIDATION_STREAMING_DEPTH), so
+    memory stays bounded by the largest subtree. libxml2 does not check ID
+    uniqueness nor IDREF targets while streaming, so the file is parsed again
+    for them even when libxml2 accepts it.
+    """
+    schema_locations, namespaces = extract_schema_locations_from_file(xml_path)
+    for schema_location in schema_locations:
+        schema_path = get_schema_path(schema_location, xml_path)
+        libxml2_errors = None
+        if VALIDATION_FAST_PATH:
+            fast_schema = get_libxml2_schema(schema_path)
+            if fast_schema is not None:
+                libxml2_errors = fast_schema.file_errors(xml_path)
+        details = libxml2_errors is None or bool(libxml2_errors)
+        
+        found = False
+        for record in _iter_streaming_records(xml_path, get_schema(schema_path), namespaces, VALIDATION_STREAMING_DEPTH, details):
+            found = True
+            yield record
+        # Errors only libxml2 reported
+        if not found and libxml2_errors:
+            for entry in libxml2_errors:
+                yield _libxml2_record(entry)
+
+def validate_xml_records(xml_path: str, tree: _ElementTree = None) -> list:
+    """Validate the XML file against its schema(s) and return structured error records.
+
+    Without a parsed tree the file is validated in streaming mode.
+    """
+    if tree is None:
+        return list(iter_xml_records_streaming(xml_path))
 
-def validate_xml_and_extract_paths(xml_path: str, tree: _ElementTree) -> (str, list):
-    """Validate the XML file using its corresponding schema and extract paths."""
     # Extract the schema location from the XML
     schema_locations = extract_schema_locations(tree)
-    all_errors = []  # To store all error messages
-    error_paths = set()  # Use a set to store unique paths
+    records = []
     for schema_location in schema_locations:
         # Resolve the schema path (either a URL or a local file path)
         schema_path = get_schema_path(schema_location, xml_path)
         
-        # Load the XML schema
-        schema = xmlschema.XMLSchema(schema_path)
+        # Fast path: libxml2 answers valid/invalid in C; only documents it rejects
+        # pay for the xmlschema pass that produces detailed error records.
+        if VALIDATION_FAST_PATH:
+            fast_schema = get_libxml2_schema(schema_path)
+            if fast_schema is not None and fast_schema.is_valid(tree):
+                continue
+        
+        # Load the XML schema (compiled once per process, see utils.schema_cache)
+        schema = get_schema(schema_path)
         
         namespaces = {k: v for k, v in tree.getroot().nsmap.items() if k is not None}
         
-        # Validate the XML against the schema
-        if not schema.is_valid(xml_path, namespaces=namespaces):
-            # Collect validation errors for this schema
-            errors = schema.iter_errors(xml_path, namespaces=namespaces)
-            for error in errors:
-                # Extract the error message
-                error_msg = str(error)
-                
-                # Append the error message to the list of all errors
-                all_errors.append(error_msg)
-                
-                # Extract path and instance using regular expressions
-                instance, path = extract_instance_and_path(error_msg)
-                
-                # Append the path to the list (you can append instance as well if needed)
-                error_paths.add(path)
+        # Validate the already-parsed tree in a single pass: the document is valid
+        # exactly when iter_errors yields nothing, so no separate is_valid() call
+        # and no re-reading of xml_path from disk.
+        for error in iter_validation_errors(schema, tree, namespaces):
+            records.append(record_from_error(error))
+    
+    return records
+
+def validate_xml_and_extract_paths(xml_path: str, tree: _ElementTree = None) -> (str, list):
+    """Validate the XML file using its corresponding schema and extract paths."""
+    records = validate_xml_records(xml_path, tree)
     
-    # Return both concatenated error messages and the list of error paths
-    return "\n".join(all_errors) if all_errors else None, list(error_paths)
+    # Return both the compact error report and the list of error paths
+    return format_records(records) if records else None, record_paths(records)
 
 def extract_instance_and_path(error_msg: str) -> (str, str):
     """Extract the path and instance from the error message using regex."""